@@ -0,0 +1,223 @@
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import platform
+import resource
+import itertools
+import multiprocessing
+
+import numpy as np
+import everycolor
+from datetime import datetime
+
+
+# engine variants. Each one is an engine name, the number of threads and
+# the shard size of the vector engine
+VARIANTS = {
+    "sort": ("sort", 1, None),
+    "tree": ("tree", 1, None),
+    "vector": ("vector", 1, None),
+    # tiny shards, so the threads are actually used on small images
+    "vector-threads": ("vector", 2, 64),
+}
+
+# variants that must generate the same image as another one
+EQUIVALENT = {
+    "vector": "sort",
+    "vector-threads": "vector",
+}
+
+# number of starting points used with each start position
+START_POINTS = {
+    "center": 1,
+    "corner": 4,
+    "random": 4,
+}
+
+
+# generates a single image and measures it. Runs in its own process, so
+# that the peak memory belongs to this workload only
+def run_workload(workload):
+    engine_name, threads, shard_size = VARIANTS[workload["variant"]]
+    if shard_size:
+        everycolor.VectorEngine.SHARD_SIZE = shard_size
+
+    # silence the progress logging
+    logging.disable(logging.INFO)
+
+    random.seed(workload["seed"])
+    width, height = everycolor.calculate_size(workload["bits"])
+    colors = everycolor.generate_colors(workload["bits"])
+    grid, filled = everycolor.generate_grid(width, height)
+
+    samples = []
+    started = time.perf_counter()
+    everycolor.place_pixels(grid, filled, colors,
+                            start_position=workload["start_position"],
+                            start_points=START_POINTS[
+                                workload["start_position"]],
+                            start_color="random",
+                            sort_colors=workload["sort_colors"],
+                            dist_selection=workload["dist_selection"],
+                            progress_pics=0, path=None,
+                            filename="benchmark", engine_name=engine_name,
+                            threads=threads, samples=samples)
+    wall_time = time.perf_counter() - started
+
+    # speed at the beginning and at the end of the placement, when the
+    # frontier is usually bigger
+    early = [s for s in samples if s[0] <= len(colors) * 0.1]
+    late = [s for s in samples if s[0] >= len(colors) * 0.9]
+
+    return {
+        **workload,
+        "wall_time": wall_time,
+        "pixels_per_second": len(colors) / wall_time,
+        "early_pixels_per_second": speed(early),
+        "late_pixels_per_second": speed(late),
+        "max_frontier": max(s[2] for s in samples),
+        # ru_maxrss is in kilobytes on linux
+        "peak_rss_mb": resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "samples": samples,
+        "image_hash": hashlib.sha256(grid.tobytes()).hexdigest(),
+    }
+
+
+# average speed between the first and the last sample
+def speed(samples):
+    if len(samples) < 2 or samples[-1][1] == samples[0][1]:
+        return None
+    return (samples[-1][0] - samples[0][0]) / (samples[-1][1] - samples[0][1])
+
+
+# unique name of a workload, without the engine variant
+def workload_key(result):
+    return (f"{result['bits']}bits-{result['dist_selection']}-"
+            f"{result['sort_colors']}-{result['start_position']}")
+
+
+# checks that equivalent variants generated the same images
+def verify(results):
+    images = {(workload_key(r), r["variant"]): r["image_hash"]
+              for r in results}
+    mismatches = []
+    for (key, variant), image_hash in images.items():
+        reference = EQUIVALENT.get(variant)
+        if reference and (key, reference) in images and \
+                images[(key, reference)] != image_hash:
+            mismatches.append(f"{key}: {variant} differs from {reference}")
+    return mismatches
+
+
+# compares the results with a previous run
+def compare(results, baseline):
+    previous = {(workload_key(r), r["variant"]): r for r in baseline}
+    lines = []
+    for r in results:
+        old = previous.get((workload_key(r), r["variant"]))
+        if not old:
+            continue
+        ratio = old["wall_time"] / r["wall_time"]
+        line = f"{workload_key(r)} {r['variant']}: {ratio:.2f}x speed"
+        if old["image_hash"] != r["image_hash"]:
+            line += ", DIFFERENT IMAGE"
+        lines.append(line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the placement "
+                                     "engines of every-color.py")
+    parser.add_argument("-b", "--bits", type=int, nargs="+",
+                        default=[6, 9, 12],
+                        help="image depth bits (defaults to 6 9 12, 15 "
+                        "is left out since the sort engine takes minutes "
+                        "for each workload)")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS),
+                        default=list(VARIANTS),
+                        help="engine variants (defaults to all)")
+    parser.add_argument("--distselection", nargs="+",
+                        choices=["min", "average"],
+                        default=["min", "average"],
+                        help="distance selections (defaults to all)")
+    parser.add_argument("--sortcolors", nargs="+",
+                        choices=["hue", "saturation", "brightness",
+                                 "default", "reverse", "random"],
+                        default=["hue", "saturation", "brightness",
+                                 "default", "reverse", "random"],
+                        help="color sortings (defaults to all)")
+    parser.add_argument("--startposition", nargs="+",
+                        choices=["center", "corner", "random"],
+                        default=["center", "corner", "random"],
+                        help="start positions (defaults to all)")
+    parser.add_argument("--seed", type=str, default="benchmark",
+                        help="random seed (defaults to benchmark)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="results file (defaults to "
+                        "benchmark-<date>.json)")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="previous results file to compare with")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s",
+                        level=logging.INFO)
+
+    workloads = []
+    for bits, dist_selection, sort_colors, start_position, variant in \
+            itertools.product(args.bits, args.distselection, args.sortcolors,
+                              args.startposition, args.variants):
+        workloads.append({
+            "bits": bits,
+            "dist_selection": dist_selection,
+            "sort_colors": sort_colors,
+            "start_position": start_position,
+            "variant": variant,
+            "seed": args.seed,
+        })
+
+    # a new process for each workload
+    results = []
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(run_workload, workloads):
+            logging.info(f"{workload_key(result)} {result['variant']}: "
+                         f"{result['wall_time']:.2f} seconds, "
+                         f"{result['pixels_per_second']:.0f} pixels per "
+                         f"second, {result['peak_rss_mb']:.0f} MB")
+            results.append(result)
+
+    mismatches = verify(results)
+    for m in mismatches:
+        logging.error(m)
+
+    output = args.output
+    if not output:
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = f"benchmark-{now}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count(),
+            "results": results,
+            "mismatches": mismatches,
+        }, f, indent=2)
+    logging.info(f"results saved: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        for line in compare(results, baseline):
+            logging.info(line)
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3535 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import collections
+import zlib
+import signal
+import socket
+import struct
+import stat
+import cProfile
+import heapq
+import queue
+import random
+import threading
+import logging
+import argparse
+import functools
+import multiprocessing
+import logging.handlers
+from multiprocessing import shared_memory
+from multiprocessing.managers import SyncManager
+
+import numpy as np
+from PIL import Image
+from math import sqrt
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+
+
+# converts an (N, 3) array of RGB values to HSV (hue, saturation, value)
+# value is the same as brightness (but b was alerady taken...)
+def calculate_hsb(colors):
+    # r, g, b normalized in range [0, 1]
+    rgb = colors / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+
+    cmax = rgb.max(axis=1)    # maximum of r, g, b
+    cmin = rgb.min(axis=1)    # minimum of r, g, b
+    diff = cmax - cmin        # diff of cmax and cmin.
+
+    # grays would divide by zero, their hue is set to 0 anyway
+    safe_diff = np.where(diff == 0, 1, diff)
+    h = np.select([
+        # cmax == cmin => hue = 0
+        cmax == cmin,
+        # cmax == r, we need to calculate h
+        cmax == r,
+        # cmax == g, we need to calculate h
+        cmax == g,
+    ], [
+        0.0,
+        (60 * ((g - b) / safe_diff) + 360) % 360,
+        (60 * ((b - r) / safe_diff) + 120) % 360,
+    ],
+        #  cmax == b, we need to calculate h
+        default=(60 * ((r - g) / safe_diff) + 240) % 360)
+
+    # cmax == 0 -> s = 0
+    safe_cmax = np.where(cmax == 0, 1, cmax)
+    s = np.where(cmax == 0, 0.0, (diff / safe_cmax) * 100)
+
+    # v calculation
+    v = cmax * 100
+    return np.stack((h, s, v), axis=1)
+
+
+# converts an (N, 3) array of HSB values, as returned by calculate_hsb,
+# back to RGB values
+def hsb_to_rgb(hsb):
+    h = hsb[:, 0] / 60
+    s = hsb[:, 1] / 100
+    v = hsb[:, 2] / 100
+
+    # sector of the color wheel and position inside it
+    sector = np.floor(h).astype(np.int64) % 6
+    f = h - np.floor(h)
+    p = v * (1 - s)
+    q = v * (1 - s * f)
+    t = v * (1 - s * (1 - f))
+
+    r = np.choose(sector, [v, q, p, p, t, v])
+    g = np.choose(sector, [t, v, v, q, p, p])
+    b = np.choose(sector, [p, p, t, v, v, q])
+    rgb = np.stack((r, g, b), axis=1) * 255
+    return np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+
+
+# octree over the RGB cube. It stores points (by key) and finds the ones
+# closest to a color without looking at every stored point
+class ColorTree:
+    def __init__(self, depth=5):
+        # number of levels below the root. Leaves are 256 >> depth wide
+        self.__depth = depth
+        # number of points inside each node, one flat list for each level
+        self.__counts = [[0] * (8 ** level) for level in range(depth + 1)]
+        # points stored inside each leaf, indexed by key
+        self.__leaves = {}
+        # leaf coordinates of each stored key
+        self.__keys = {}
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __contains__(self, key):
+        return key in self.__keys
+
+    # iterates over the keys, leaf by leaf in insertion order. Inserting
+    # them again in this order gives back a tree returning the same
+    # nearest keys, in the same order
+    def __iter__(self):
+        for leaf in self.__leaves.values():
+            yield from leaf
+
+    # flat index of a node given its level and coordinates
+    def __index(self, level, i, j, k):
+        return (i << (2 * level)) | (j << level) | k
+
+    # add (or move) a point to the tree
+    def insert(self, key, point):
+        if key in self.__keys:
+            self.remove(key)
+
+        # leaf coordinates, clamped inside the cube
+        size = 256 >> self.__depth
+        last = (1 << self.__depth) - 1
+        i, j, k = [min(max(int(p) // size, 0), last) for p in point]
+
+        # update the counts of every node containing the point
+        for level in range(self.__depth + 1):
+            shift = self.__depth - level
+            index = self.__index(level, i >> shift, j >> shift, k >> shift)
+            self.__counts[level][index] += 1
+
+        leaf = self.__index(self.__depth, i, j, k)
+        self.__leaves.setdefault(leaf, {})[key] = point
+        self.__keys[key] = (i, j, k)
+
+    # remove a point from the tree
+    def remove(self, key):
+        i, j, k = self.__keys.pop(key)
+
+        for level in range(self.__depth + 1):
+            shift = self.__depth - level
+            index = self.__index(level, i >> shift, j >> shift, k >> shift)
+            self.__counts[level][index] -= 1
+
+        leaf = self.__index(self.__depth, i, j, k)
+        del self.__leaves[leaf][key]
+        if not self.__leaves[leaf]:
+            del self.__leaves[leaf]
+
+    # returns the minimum distance from color and all the keys at that
+    # distance. score(key) can replace the squared distance, as long as
+    # it's never smaller than the squared distance between color and the
+    # stored point. With first, only the closest non empty leaf is searched
+    # (the result is approximate, off by at most the leaf diagonal)
+    def nearest(self, color, score=None, first=False):
+        r, g, b = color
+        best = None
+        found = []
+
+        # best first search. Nodes are sorted by their minimum distance
+        heap = [(0, 0, 0, 0, 0)]
+        while heap:
+            bound, level, i, j, k = heapq.heappop(heap)
+            if best is not None and bound > best:
+                # no closer point can be found
+                break
+
+            if level == self.__depth:
+                # leaf, check every point
+                leaf = self.__leaves[self.__index(level, i, j, k)]
+                for key, point in leaf.items():
+                    if score:
+                        dist = score(key)
+                    else:
+                        dist = (r - point[0]) ** 2 + \
+                               (g - point[1]) ** 2 + \
+                               (b - point[2]) ** 2
+
+                    if best is None or dist < best:
+                        best = dist
+                        found = [key]
+                    elif dist == best:
+                        found.append(key)
+                if first:
+                    break
+                continue
+
+            # check the 8 children of the node
+            level += 1
+            size = 256 >> level
+            counts = self.__counts[level]
+            for ci in (2 * i, 2 * i + 1):
+                # distance from the child box, along each axis
+                di = max(ci * size - r, r - (ci + 1) * size, 0) ** 2
+                for cj in (2 * j, 2 * j + 1):
+                    dj = max(cj * size - g, g - (cj + 1) * size, 0) ** 2
+                    for ck in (2 * k, 2 * k + 1):
+                        if not counts[self.__index(level, ci, cj, ck)]:
+                            # empty node
+                            continue
+                        dk = max(ck * size - b, b - (ck + 1) * size, 0) ** 2
+                        bound = di + dj + dk
+                        if best is None or bound <= best:
+                            heapq.heappush(heap, (bound, level, ci, cj, ck))
+
+        return best, found
+
+
+# generates all the colors needed in the script, as a (N, 3) array
+def generate_colors(bits):
+    # total items for each channel
+    length = int(2 ** (bits / 3))
+    # step of each channel
+    step = int(256 / length)
+    # values of each channel
+    channel = np.arange(0, length * step, step, dtype=np.uint8)
+    # every combination of the channels, blue changing faster
+    r, g, b = np.meshgrid(channel, channel, channel, indexing="ij")
+    colors = np.stack((r.ravel(), g.ravel(), b.ravel()), axis=1)
+    return colors
+
+
+# calculate image size in pixels by number of colors
+def calculate_size(bits):
+    # total number of colors
+    color_number = int(2 ** bits)
+    if sqrt(color_number).is_integer():
+        # if the image is a square
+        width = int(sqrt(color_number))
+        height = int(sqrt(color_number))
+    else:
+        # in case the image is not a square
+        height = int(sqrt(color_number / 2))
+        width = int(color_number / height)
+    return width, height
+
+
+# generate an empty grid and its occupancy map
+# When canvas_path is set, the grid is kept in a memory mapped .npy file
+# instead of memory. The file is stored row by row, like the image
+def generate_grid(width, height, canvas_path=None):
+    if canvas_path:
+        canvas = np.lib.format.open_memmap(canvas_path, mode="w+",
+                                           dtype=np.uint8,
+                                           shape=(height, width, 3))
+        grid = canvas.transpose(1, 0, 2)
+    else:
+        grid = np.zeros(shape=(width, height, 3), dtype=np.uint8)
+    filled = np.zeros(shape=(width, height), dtype=bool)
+    return grid, filled
+
+
+# refines an image placed with the given bits to 3 more bits. Each pixel
+# becomes a block of 8 pixels (4x2 or 2x4, as the image size grows) holding
+# the 8 colors that have the pixel color as their first bits. Inside the
+# block, colors are spread greedily, closest first, towards the colors the
+# pixels would have if the image was smoothly scaled up. Blocks are
+# refined chunk pixels at a time. The refined image is written in out.
+# If order is set, the placement order of the refined pixels is written in
+# out_order: blocks follow the order of their pixel, and inside a block
+# pixels follow the order they got their color
+def refine_grid(grid, bits, out, chunk=1 << 16, order=None,
+                out_order=None):
+    width, height = grid.shape[:2]
+    scale_x = out.shape[0] // width
+    scale_y = out.shape[1] // height
+    # the added bit of each channel is worth half of the current step
+    half = 256 // int(2 ** (bits / 3)) // 2
+    children = ((np.arange(8)[:, np.newaxis] >> np.arange(2, -1, -1)) &
+                1) * half
+    # pixels of a block, relative to its corner
+    offsets = np.array([(i, j) for i in range(scale_x)
+                        for j in range(scale_y)])
+    coarse = grid.astype(np.float32)
+
+    # coordinates of the fine pixel centers in the coarse image, split
+    # into the two closest coarse pixels and the weight of the second one
+    def interpolation(fine, scale, size):
+        u = (fine + 0.5) / scale - 0.5
+        low = np.floor(u)
+        weight = (u - low)[..., np.newaxis]
+        return (np.clip(low, 0, size - 1).astype(np.int64),
+                np.clip(low + 1, 0, size - 1).astype(np.int64), weight)
+
+    columns = max(chunk // height, 1)
+    for start in range(0, width, columns):
+        xs, ys = np.meshgrid(np.arange(start, min(start + columns, width)),
+                             np.arange(height), indexing="ij")
+        xs, ys = xs.ravel(), ys.ravel()
+        # pixels of each block
+        fine_x = xs[:, np.newaxis] * scale_x + offsets[:, 0]
+        fine_y = ys[:, np.newaxis] * scale_y + offsets[:, 1]
+
+        x0, x1, wx = interpolation(fine_x, scale_x, width)
+        y0, y1, wy = interpolation(fine_y, scale_y, height)
+        targets = (coarse[x0, y0] * (1 - wx) + coarse[x1, y0] * wx) * \
+            (1 - wy) + (coarse[x0, y1] * (1 - wx) + coarse[x1, y1] * wx) * wy
+
+        colors = grid[xs, ys].astype(np.int64)[:, np.newaxis] + children
+        # (blocks, pixels, colors) squared distances
+        diffs = targets[:, :, np.newaxis] - colors[:, np.newaxis]
+        costs = (diffs * diffs).sum(axis=3)
+
+        blocks = np.arange(len(xs))
+        for step in range(8):
+            best = costs.reshape(len(blocks), -1).argmin(axis=1)
+            pixel, color = np.divmod(best, 8)
+            out[fine_x[blocks, pixel], fine_y[blocks, pixel]] = \
+                colors[blocks, color]
+            if order is not None:
+                out_order[fine_x[blocks, pixel], fine_y[blocks, pixel]] = \
+                    order[xs, ys] * 8 + step
+            costs[blocks, pixel] = np.inf
+            costs[blocks, :, color] = np.inf
+
+
+# refines an image placed with coarse bits up to bits, 3 bits at a time.
+# The final grid is memory mapped when canvas_path is set. Returns the
+# refined grid and its placement order (None if order is not set)
+def refine_image(grid, coarse, bits, canvas_path=None, order=None):
+    for level in range(coarse, bits, 3):
+        last = level + 3 == bits
+        width, height = calculate_size(level + 3)
+        out, _ = generate_grid(width, height, canvas_path if last else None)
+        out_order = None
+        if order is not None:
+            out_order = np.empty((width, height), dtype=np.uint32)
+        refine_grid(grid, level, out, order=order, out_order=out_order)
+        grid, order = out, out_order
+    return grid, order
+
+
+# converts an (N, 3) array of RGB values to linear RGB in range [0, 1]
+def linear_rgb(colors):
+    c = colors / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+# converts an (N, 3) array of RGB values to CIE Lab (D65 white point)
+def rgb_to_lab(colors):
+    xyz = linear_rgb(colors) @ np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]).T
+    # normalized by the white point
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz),
+                 xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    lightness = 116 * f[:, 1] - 16
+    a = 500 * (f[:, 0] - f[:, 1])
+    b = 200 * (f[:, 1] - f[:, 2])
+    return np.stack((lightness, a, b), axis=1)
+
+
+# converts an (N, 3) array of RGB values to OKLab
+def rgb_to_oklab(colors):
+    lms = linear_rgb(colors) @ np.array([
+        [0.4122214708, 0.5363325363, 0.0514459929],
+        [0.2119034982, 0.6806995451, 0.1073969566],
+        [0.0883024619, 0.2817188376, 0.6299787005],
+    ]).T
+    return np.cbrt(lms) @ np.array([
+        [0.2104542553, 0.7936177850, -0.0040720468],
+        [1.9779984951, -2.4285922050, 0.4505937099],
+        [0.0259040371, 0.7827717662, -0.8086757660],
+    ]).T
+
+
+# coordinates of the colors in the space where their distance is measured.
+# Distances are always euclidean (squared), so every metric is a
+# conversion of the RGB values:
+#   rgb: RGB values, as they are
+#   weighted: RGB scaled by the weights 2, 4, 3 (the eye is more
+#       sensitive to green)
+#   lab: CIE Lab, distance is delta E 1976
+#   oklab: OKLab
+# Coordinates of the whole palette are computed once and stored in a
+# table indexed by color id
+class ColorSpace:
+    METRICS = ["rgb", "weighted", "lab", "oklab"]
+
+    def __init__(self, colors, metric="rgb", table=None):
+        self.__metric = metric
+        # channel size of the palette
+        self.__length = round(len(colors) ** (1 / 3))
+        self.__step = 256 // self.__length
+
+        if metric == "rgb":
+            # colors are their own coordinates, exact integer distances.
+            # No table is needed
+            self.__table = None
+            return
+
+        if table is not None:
+            # already computed
+            self.__table = table
+            return
+
+        if metric == "weighted":
+            coordinates = colors * np.sqrt([2, 4, 3])
+        elif metric == "lab":
+            coordinates = rgb_to_lab(colors)
+        elif metric == "oklab":
+            coordinates = rgb_to_oklab(colors)
+        # moved and scaled (equally on every axis, so distances keep
+        # their order) inside the [0, 256) cube used by the ColorTree
+        coordinates = coordinates - coordinates.min(axis=0)
+        coordinates *= 255 / coordinates.max()
+        coordinates = coordinates.astype(np.float32)
+
+        # coordinates indexed by color id
+        self.__table = np.empty_like(coordinates)
+        self.__table[self.index(colors)] = coordinates
+
+    # numpy type of the coordinates
+    @property
+    def dtype(self):
+        if self.__table is None:
+            return np.dtype(np.int32)
+        return self.__table.dtype
+
+    @property
+    def metric(self):
+        return self.__metric
+
+    # coordinates of every color, indexed by color id (None for rgb)
+    @property
+    def table(self):
+        return self.__table
+
+    # ids of an (N, 3) array of colors (their position in the palette)
+    def index(self, colors):
+        channels = colors.astype(np.int64) // self.__step
+        return (channels[:, 0] * self.__length + channels[:, 1]) * \
+            self.__length + channels[:, 2]
+
+    # coordinates of a color, as a tuple
+    def coordinates(self, color):
+        if self.__table is None:
+            return tuple(color)
+        r, g, b = color
+        index = ((r // self.__step) * self.__length + g // self.__step) * \
+            self.__length + b // self.__step
+        return tuple(self.__table[index].tolist())
+
+
+# version of the cached tables. To be increased whenever the way they are
+# generated changes
+CACHE_VERSION = 1
+
+
+# loads a table from the cache folder, generating and saving it first if
+# it's missing or damaged. Tables are memory mapped read only, so all the
+# processes loading the same table share its memory. Tables of other
+# versions are deleted
+def cached_table(cache_dir, name, shape, generate):
+    folder = Path(cache_dir)
+    folder.mkdir(parents=True, exist_ok=True)
+    full_path = folder / f"{name}-v{CACHE_VERSION}.npy"
+    try:
+        table = np.load(full_path, mmap_mode="r")
+        if table.shape == shape:
+            return table
+    except (OSError, ValueError):
+        # missing or damaged
+        pass
+
+    for old_path in folder.glob(f"{name}-v*.npy"):
+        # the current version is replaced below, other processes might be
+        # loading it
+        if old_path != full_path:
+            old_path.unlink(missing_ok=True)
+    # written elsewhere first, other processes might be loading it
+    temp_path = folder / f"{name}-v{CACHE_VERSION}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, generate())
+    os.replace(temp_path, full_path)
+    return np.load(full_path, mmap_mode="r")
+
+
+# palettes, sort keys and color spaces are generated once for each bit
+# depth (and sorting, or metric) and then shared by all the images
+# generated by the process. With a cache folder, they are also saved
+# there and shared by every process and run. Palettes are read only
+@functools.lru_cache(maxsize=None)
+def palette(bits, cache_dir=None):
+    if cache_dir:
+        return cached_table(cache_dir, f"palette-{bits}bits", (2 ** bits, 3),
+                            lambda: generate_colors(bits))
+    colors = generate_colors(bits)
+    colors.flags.writeable = False
+    return colors
+
+
+# keys of the palette colors for a sorting by hue, saturation or
+# brightness. None for the other sortings
+@functools.lru_cache(maxsize=None)
+def sort_keys(bits, sort_colors, cache_dir=None):
+    if sort_colors not in ["hue", "saturation", "brightness"]:
+        return None
+    channel = ["hue", "saturation", "brightness"].index(sort_colors)
+    colors = palette(bits, cache_dir)
+    if cache_dir:
+        return cached_table(cache_dir, f"{sort_colors}-{bits}bits",
+                            (2 ** bits,),
+                            lambda: calculate_hsb(colors)[:, channel])
+    return calculate_hsb(colors)[:, channel]
+
+
+@functools.lru_cache(maxsize=None)
+def color_space(bits, metric, cache_dir=None):
+    colors = palette(bits, cache_dir)
+    if cache_dir and metric != "rgb":
+        table = cached_table(cache_dir, f"{metric}-{bits}bits",
+                             (2 ** bits, 3),
+                             lambda: ColorSpace(colors, metric).table)
+        return ColorSpace(colors, metric, table)
+    return ColorSpace(colors, metric)
+
+
+# calculate difference between two colors
+def color_difference(color1, color2):
+    return (color1[0] - color2[0]) ** 2 + \
+           (color1[1] - color2[1]) ** 2 + \
+           (color1[2] - color2[2]) ** 2
+
+
+# find free neighbors of a pixel by iterating over its square container.
+# Positions are packed as x * height + y
+def find_free_neighbors(filled, pos):
+    # grid size
+    width, height = filled.shape
+    x, y = divmod(pos, height)
+
+    free_neighbors = []
+    # horizontal
+    for px in range(max(x - 1, 0), min(x + 2, width)):
+        # vertical
+        for py in range(max(y - 1, 0), min(y + 2, height)):
+            if px == x and py == y:
+                # same as central
+                continue
+            if not filled[px, py]:
+                # if empty
+                free_neighbors.append(px * height + py)
+
+    return free_neighbors
+
+
+# colors of the full neighbors of a pixel
+def find_neighbor_colors(grid, filled, pos):
+    width, height = filled.shape
+    x, y = divmod(pos, height)
+
+    colors = []
+    for px in range(max(x - 1, 0), min(x + 2, width)):
+        for py in range(max(y - 1, 0), min(y + 2, height)):
+            if px == x and py == y:
+                # same as central
+                continue
+            if filled[px, py]:
+                colors.append(tuple(grid[px, py].tolist()))
+
+    return colors
+
+
+# calculates color difference between a color and its neighbors
+def calculate_diff(grid, filled, pos, color, dist_selection, space):
+    width, height = filled.shape
+    x, y = divmod(pos, height)
+
+    diffs = []
+    # same as find_free_neighbors but we want to find full neighbors (not
+    # empty as in the other)
+    # horizontal
+    for px in range(max(x - 1, 0), min(x + 2, width)):
+        # vertical
+        for py in range(max(y - 1, 0), min(y + 2, height)):
+            if px == x and py == y:
+                # same as central
+                continue
+            if filled[px, py]:
+                # if full
+                neighbor = space.coordinates(grid[px, py].tolist())
+                diffs.append(color_difference(neighbor, color))
+
+    if dist_selection == "average":
+        # returns average according to diff
+        average = sum(diffs) / len(diffs)
+        return average
+    elif dist_selection == "min":
+        # returns least diff
+        return min(diffs)
+
+
+# set of available pixels with O(1) add, remove and membership test.
+# Positions are kept in a compact list of slots: removing a position moves
+# the last one into its slot
+class Frontier:
+    def __init__(self):
+        # slot of each position
+        self.__slots = {}
+        # position in each slot
+        self.__positions = []
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def __contains__(self, pos):
+        return pos in self.__slots
+
+    def __iter__(self):
+        return iter(self.__positions)
+
+    @property
+    def positions(self):
+        return self.__positions
+
+    # slot of a position
+    def slot(self, pos):
+        return self.__slots[pos]
+
+    # add a position, returns its slot
+    def add(self, pos):
+        slot = len(self.__positions)
+        self.__slots[pos] = slot
+        self.__positions.append(pos)
+        return slot
+
+    # remove a position, returns the slot it was in. If it's not the last
+    # slot, it now holds the position that was in the last one
+    def remove(self, pos):
+        slot = self.__slots.pop(pos)
+        last = self.__positions.pop()
+        if slot < len(self.__positions):
+            self.__positions[slot] = last
+            self.__slots[last] = slot
+        return slot
+
+
+# original engine. Every time a new color is placed, all the available
+# pixels are scored one by one by their color difference
+class SortEngine:
+    def __init__(self, grid, filled, dist_selection, space):
+        self.__grid = grid
+        self.__filled = filled
+        self.__dist_selection = dist_selection
+        self.__space = space
+        # all available pixels (free with at least one neighbor)
+        self.__available_pixels = Frontier()
+
+    # number of available pixels
+    def __len__(self):
+        return len(self.__available_pixels)
+
+    # find the best pixel for a color
+    def select(self, color):
+        positions = self.__available_pixels.positions
+        diffs = [calculate_diff(self.__grid, self.__filled, p, color,
+                                self.__dist_selection, self.__space)
+                 for p in positions]
+        # pick the closest one, random among equals
+        best = min(diffs)
+        candidates = [p for p, d in zip(positions, diffs) if d == best]
+        return random.choice(candidates)
+
+    # update the available pixels after a color has been placed
+    def update(self, pos, color):
+        # remove the pixel that we just put
+        if pos in self.__available_pixels:
+            self.__available_pixels.remove(pos)
+
+        # add all new available pixels
+        for n in find_free_neighbors(self.__filled, pos):
+            if n not in self.__available_pixels:
+                self.__available_pixels.add(n)
+
+    # available pixels, in the order needed to restore the engine
+    def state(self):
+        return np.array(self.__available_pixels.positions, dtype=np.int64)
+
+    # restore the engine from the grid and a previous state
+    def restore(self, positions):
+        for pos in positions.tolist():
+            self.__available_pixels.add(pos)
+
+
+# octree engine. Instead of sorting the available pixels, the colors around
+# them are stored in a ColorTree and the best pixel is found with a nearest
+# neighbor query
+class TreeEngine:
+    # approximate selections between two checks against the exact one
+    CHECK_INTERVAL = 100
+
+    def __init__(self, grid, filled, dist_selection, space, approx=0):
+        self.__grid = grid
+        self.__filled = filled
+        self.__dist_selection = dist_selection
+        self.__space = space
+        # min: placed pixels with at least one free neighbor, by their color
+        # average: available pixels, by the average of their neighbors
+        if approx:
+            # buckets 2 ** approx wide, only the closest one is searched
+            self.__tree = ColorTree(depth=8 - approx)
+        else:
+            self.__tree = ColorTree()
+        self.__approx = approx
+        # average only: sum of r, g, b, squared norms and count of the
+        # neighbors of each available pixel
+        self.__sums = {}
+        # approximate selections, checks, wrong picks and total distance
+        # lost by the wrong picks
+        self.__selections = 0
+        self.__checks = 0
+        self.__misses = 0
+        self.__error = 0.0
+
+    # number of points in the tree
+    def __len__(self):
+        return len(self.__tree)
+
+    # average color difference between a color and the neighbors of a pixel
+    def __average_diff(self, pos, color):
+        sr, sg, sb, sq, count = self.__sums[pos]
+        r, g, b = color
+        diffs = count * (r * r + g * g + b * b) - \
+            2 * (r * sr + g * sg + b * sb) + sq
+        return diffs / count
+
+    # closest points of the tree, and their distance
+    def __nearest(self, color, first=False):
+        if self.__dist_selection == "min":
+            return self.__tree.nearest(color, first=first)
+        elif self.__dist_selection == "average":
+            return self.__tree.nearest(color,
+                                       score=lambda pos:
+                                       self.__average_diff(pos, color),
+                                       first=first)
+
+    # find the best pixel for a color
+    def select(self, color):
+        distance, nearest = self.__nearest(color, first=self.__approx > 0)
+
+        if self.__approx:
+            self.__selections += 1
+            if self.__selections % self.CHECK_INTERVAL == 0:
+                # compare with the exact choice
+                exact, _ = self.__nearest(color)
+                self.__checks += 1
+                if distance > exact:
+                    self.__misses += 1
+                    self.__error += sqrt(distance) - sqrt(exact)
+
+        if self.__dist_selection == "min":
+            # the closest placed colors. All their free neighbors are
+            # at the same distance
+            candidates = []
+            for pos in nearest:
+                for n in find_free_neighbors(self.__filled, pos):
+                    if n not in candidates:
+                        candidates.append(n)
+        elif self.__dist_selection == "average":
+            candidates = nearest
+
+        # random among equals
+        return random.choice(candidates)
+
+    # approximate selections checked against the exact ones, how many of
+    # them picked a worse pixel and by how much on average (in color
+    # distance, not squared)
+    def approx_quality(self):
+        error = self.__error / self.__misses if self.__misses else 0.0
+        return self.__checks, self.__misses, error
+
+    # update the tree after a color has been placed
+    def update(self, pos, color):
+        free_neighbors = find_free_neighbors(self.__filled, pos)
+
+        if self.__dist_selection == "min":
+            if free_neighbors:
+                self.__tree.insert(pos, color)
+
+            # neighbors without free pixels around can't be picked anymore
+            width, height = self.__filled.shape
+            x, y = divmod(pos, height)
+            for px in range(max(x - 1, 0), min(x + 2, width)):
+                for py in range(max(y - 1, 0), min(y + 2, height)):
+                    n = px * height + py
+                    if n not in self.__tree:
+                        continue
+                    if not find_free_neighbors(self.__filled, n):
+                        self.__tree.remove(n)
+
+        elif self.__dist_selection == "average":
+            # the pixel is not available anymore
+            if pos in self.__tree:
+                self.__tree.remove(pos)
+                del self.__sums[pos]
+
+            # add the new color to its free neighbors
+            for n in free_neighbors:
+                self.__add_color(n, color)
+
+    # add a neighbor color to the sums of an available pixel (average only)
+    def __add_color(self, pos, color):
+        r, g, b = color
+        sr, sg, sb, sq, count = self.__sums.get(pos, (0, 0, 0, 0, 0))
+        sums = (sr + r, sg + g, sb + b,
+                sq + r * r + g * g + b * b, count + 1)
+        self.__sums[pos] = sums
+        # the tree is keyed by the average color
+        average = (sums[0] / sums[4], sums[1] / sums[4], sums[2] / sums[4])
+        self.__tree.insert(pos, average)
+
+    # keys of the tree, in the order needed to restore the engine
+    def state(self):
+        return np.array(list(self.__tree), dtype=np.int64)
+
+    # restore the engine from the grid and a previous state
+    def restore(self, positions):
+        height = self.__filled.shape[1]
+        for pos in positions.tolist():
+            if self.__dist_selection == "min":
+                x, y = divmod(pos, height)
+                color = self.__grid[x, y].tolist()
+                self.__tree.insert(pos, self.__space.coordinates(color))
+            elif self.__dist_selection == "average":
+                for color in find_neighbor_colors(self.__grid, self.__filled,
+                                                  pos):
+                    self.__add_color(pos, self.__space.coordinates(color))
+
+
+# vectorized engine. Each available pixel caches a summary of its
+# neighborhood (its neighbors colors for min, their sums for average) and
+# only the pixels around the last placed one are updated. Every color is
+# then scored against all the available pixels in a single numpy operation.
+# With more than one thread, the available pixels are split in shards that
+# are scored in parallel (numpy releases the GIL while computing)
+class VectorEngine:
+    # placeholder for missing neighbors, farther than any real color
+    FAR = 1 << 12
+    # minimum number of available pixels scored by each thread
+    SHARD_SIZE = 16384
+    # maximum size of the (colors, available pixels) score matrix of a batch
+    BATCH_CELLS = 1 << 16
+
+    def __init__(self, grid, filled, dist_selection, space, capacity=1024,
+                 threads=1):
+        self.__grid = grid
+        self.__filled = filled
+        self.__dist_selection = dist_selection
+        self.__space = space
+        # exact integers for rgb, floats for the other metrics
+        if space.dtype == np.int32:
+            self.__dtype = np.int64
+        else:
+            self.__dtype = np.float64
+        self.__threads = threads
+        if threads > 1:
+            self.__executor = ThreadPoolExecutor(max_workers=threads)
+        else:
+            self.__executor = None
+        # available pixels, their slot indexes the arrays below
+        self.__frontier = Frontier()
+        # number of placed neighbors in each slot
+        self.__counts = np.zeros(capacity, dtype=np.int64)
+        if dist_selection == "min":
+            # colors of the placed neighbors
+            self.__neighbors = np.full((capacity, 8, 3), self.FAR,
+                                       dtype=space.dtype)
+        elif dist_selection == "average":
+            # sum of the colors and of their squared norms
+            self.__sums = np.zeros((capacity, 3), dtype=self.__dtype)
+            self.__squares = np.zeros(capacity, dtype=self.__dtype)
+
+    # number of available pixels
+    def __len__(self):
+        return len(self.__frontier)
+
+    # make room for more available pixels
+    def __grow(self):
+        capacity = 2 * len(self.__counts)
+        extra = capacity - len(self.__counts)
+        self.__counts = np.resize(self.__counts, capacity)
+        if self.__dist_selection == "min":
+            self.__neighbors = np.concatenate(
+                (self.__neighbors,
+                 np.full((extra, 8, 3), self.FAR,
+                         dtype=self.__space.dtype)))
+        elif self.__dist_selection == "average":
+            self.__sums = np.resize(self.__sums, (capacity, 3))
+            self.__squares = np.resize(self.__squares, capacity)
+
+    # add an available pixel with an empty neighborhood
+    def __add(self, pos):
+        if len(self.__frontier) == len(self.__counts):
+            self.__grow()
+
+        slot = self.__frontier.add(pos)
+        self.__counts[slot] = 0
+        if self.__dist_selection == "min":
+            self.__neighbors[slot] = self.FAR
+        elif self.__dist_selection == "average":
+            self.__sums[slot] = 0
+            self.__squares[slot] = 0
+        return slot
+
+    # remove an available pixel, moving the last one in its slot
+    def __remove(self, pos):
+        slot = self.__frontier.remove(pos)
+        last = len(self.__frontier)
+        if slot == last:
+            return
+
+        self.__counts[slot] = self.__counts[last]
+        if self.__dist_selection == "min":
+            self.__neighbors[slot] = self.__neighbors[last]
+        elif self.__dist_selection == "average":
+            self.__sums[slot] = self.__sums[last]
+            self.__squares[slot] = self.__squares[last]
+
+    # scores the available pixels in the slots between start and stop.
+    # Returns the best score and the slots that reach it
+    def __score(self, c, start, stop):
+        if self.__dist_selection == "min":
+            diffs = self.__neighbors[start:stop] - c
+            scores = (diffs * diffs).sum(axis=2).min(axis=1)
+        elif self.__dist_selection == "average":
+            counts = self.__counts[start:stop]
+            diffs = counts * (c @ c) - 2 * (self.__sums[start:stop] @ c) + \
+                self.__squares[start:stop]
+            scores = diffs / counts
+
+        best = scores.min()
+        return best, np.flatnonzero(scores == best) + start
+
+    # find the best pixel for a color
+    def select(self, color):
+        size = len(self.__frontier)
+        c = np.array(color, dtype=self.__dtype)
+
+        shards = min(self.__threads, size // self.SHARD_SIZE)
+        if shards > 1:
+            # score each shard in its own thread
+            bounds = np.linspace(0, size, shards + 1).astype(int)
+            results = list(self.__executor.map(
+                lambda start, stop: self.__score(c, start, stop),
+                bounds[:-1], bounds[1:]))
+            best = min(r[0] for r in results)
+            # shards are in slot order, so the candidates are the same
+            # (and in the same order) as when scoring everything at once
+            candidates = np.concatenate([r[1] for r in results
+                                         if r[0] == best])
+        else:
+            best, candidates = self.__score(c, 0, size)
+
+        # random among equals
+        return self.__frontier.positions[random.choice(candidates)]
+
+    # find the pixels for the next colors at once. Each color gets the best
+    # pixel not taken by the colors before it, scored before any of them
+    # is placed (the pixels they make available are not considered).
+    # Colors are taken until the score matrix is BATCH_CELLS big, at least
+    # one. Returns the selected pixels, one for each taken color
+    def select_batch(self, colors):
+        size = len(self.__frontier)
+        k = min(len(colors), max(self.BATCH_CELLS // size, 1), size)
+        c = np.array(colors[:k], dtype=self.__dtype)
+
+        # one row for each color
+        if self.__dist_selection == "min":
+            # |n - c|^2 = |n|^2 - 2 n.c + |c|^2, with one matrix product
+            neighbors = self.__neighbors[:size].reshape(-1, 3).astype(
+                self.__dtype)
+            diffs = (neighbors * neighbors).sum(axis=1)[:, np.newaxis] - \
+                2 * (neighbors @ c.T) + (c * c).sum(axis=1)
+            scores = diffs.reshape(size, 8, -1).min(axis=1).T
+        elif self.__dist_selection == "average":
+            counts = self.__counts[:size]
+            diffs = np.outer((c * c).sum(axis=1), counts) - \
+                2 * (c @ self.__sums[:size].T) + self.__squares[:size]
+            scores = diffs / counts
+        scores = scores.astype(np.float64)
+
+        positions = []
+        for row in scores:
+            best = row.min()
+            # random among equals
+            slot = random.choice(np.flatnonzero(row == best))
+            positions.append(self.__frontier.positions[slot])
+            # a pixel takes a single color
+            scores[:, slot] = np.inf
+        return positions
+
+    # update the neighborhoods around a newly placed color
+    def update(self, pos, color):
+        # the pixel is not available anymore
+        if pos in self.__frontier:
+            self.__remove(pos)
+
+        for n in find_free_neighbors(self.__filled, pos):
+            if n in self.__frontier:
+                slot = self.__frontier.slot(n)
+            else:
+                slot = self.__add(n)
+            self.__add_color(slot, color)
+
+    # add a neighbor color to the summary of a slot
+    def __add_color(self, slot, color):
+        r, g, b = color
+        if self.__dist_selection == "min":
+            self.__neighbors[slot, self.__counts[slot]] = color
+        elif self.__dist_selection == "average":
+            self.__sums[slot] += color
+            self.__squares[slot] += r * r + g * g + b * b
+        self.__counts[slot] += 1
+
+    # available pixels, in the order needed to restore the engine
+    def state(self):
+        return np.array(self.__frontier.positions, dtype=np.int64)
+
+    # restore the engine from the grid and a previous state
+    def restore(self, positions):
+        for pos in positions.tolist():
+            slot = self.__add(pos)
+            for color in find_neighbor_colors(self.__grid, self.__filled,
+                                              pos):
+                self.__add_color(slot, self.__space.coordinates(color))
+
+
+# available placement engines
+ENGINES = {
+    "sort": SortEngine,
+    "tree": TreeEngine,
+    "vector": VectorEngine,
+}
+
+
+# creates a placement engine, passing the options it understands
+def create_engine(grid, filled, dist_selection, space, engine_name="sort",
+                  threads=1, approx=0):
+    if engine_name == "vector":
+        return VectorEngine(grid, filled, dist_selection, space,
+                            threads=threads)
+    elif engine_name == "tree":
+        return TreeEngine(grid, filled, dist_selection, space,
+                          approx=approx)
+    return ENGINES[engine_name](grid, filled, dist_selection, space)
+
+
+# accepted values of the placement settings
+START_POSITIONS = ["center", "corner", "random"]
+START_COLORS = ["white", "black", "random"]
+SORT_COLORS = ["hue", "saturation", "brightness", "default", "reverse",
+               "random"]
+DIST_SELECTIONS = ["min", "average"]
+
+
+# checks a dict of placement settings, named as the arguments of
+# EveryColor.configure. Only the settings in the dict are checked, so
+# approx and batch need their engine_name. Raises ValueError with the
+# reason if a setting is not valid
+def check_settings(settings):
+    choices = {
+        "start_position": START_POSITIONS,
+        "start_color": START_COLORS,
+        "sort_colors": SORT_COLORS,
+        "dist_selection": DIST_SELECTIONS,
+        "metric": ColorSpace.METRICS,
+        "engine_name": list(ENGINES),
+    }
+    for name, values in choices.items():
+        if name in settings and settings[name] not in values:
+            raise ValueError(f"{name} must be one of {', '.join(values)}, "
+                             f"not {settings[name]!r}")
+
+    # smallest value of the integer settings
+    minimums = {"bits": 3, "start_points": 1, "approx": 0, "batch": 1,
+                "threads": 1}
+    for name, minimum in minimums.items():
+        if name not in settings:
+            continue
+        value = settings[name]
+        if not isinstance(value, int) or isinstance(value, bool) or \
+                value < minimum:
+            raise ValueError(f"{name} must be an integer of at least "
+                             f"{minimum}, not {value!r}")
+
+    if settings.get("bits", 3) % 3 != 0:
+        raise ValueError("the bit number must be divisible by 3")
+    if settings.get("approx", 0) > 8:
+        raise ValueError("approx must be at most 8")
+    if settings.get("approx", 0) and settings.get("engine_name") != "tree":
+        raise ValueError("approximate selection needs the tree engine")
+    if settings.get("batch", 1) > 1 and \
+            settings.get("engine_name") != "vector":
+        raise ValueError("batch placement needs the vector engine")
+
+
+# returns the position of the i-th starting pixel, or None if it must
+# be placed like any other pixel
+def start_pixel(filled, i, start_position):
+    # grid size
+    width, height = filled.shape
+
+    if start_position == "center" and i == 0:
+        # if center, we use only the first one
+        x, y = int(width/2), int(height/2)
+    elif start_position == "corner" and i < 4:
+        # only the first 4 corners
+        # bit masking to get corners
+        x = ((i >> 1) & 1) * (width - 1)
+        y = ((i >> 0) & 1) * (height - 1)
+    elif start_position == "random":
+        # random position
+        x, y = random.randrange(width), random.randrange(height)
+    else:
+        return None
+
+    if filled[x, y]:
+        # already taken by another starting pixel
+        return None
+    return x * height + y
+
+
+# puts the start color in front and sorts the colors before placing them
+# (hue, saturation or brightness) of the colors can be passed as keys, so
+# they are not computed again. Colors are reordered by index, only the
+# final order is copied
+def order_colors(colors, start_color, sort_colors, keys=None):
+    order = np.arange(len(colors))
+
+    # start color picking
+    if start_color == "white":
+        # colors list is built from least to most colored, so we need to put
+        # the last item in front
+        order = np.roll(order, 1)
+    elif start_color == "black":
+        # first color is already the darkest, so no need to do anything
+        pass
+    elif start_color == "random":
+        # pick a random element index
+        color_index = random.randrange(len(colors))
+        # put the random selected color in front
+        order = np.concatenate(([color_index],
+                                np.delete(order, color_index)))
+
+    # sort colors
+    if sort_colors in ["hue", "saturation", "brightness"]:
+        # sort by hue, saturation or value (brightness)
+        if keys is None:
+            channel = ["hue", "saturation", "brightness"].index(sort_colors)
+            keys = calculate_hsb(colors)[:, channel]
+        order = order[np.argsort(keys[order], kind="stable")]
+    elif sort_colors == "default":
+        # do nothing
+        pass
+    elif sort_colors == "reverse":
+        # reverse
+        order = order[::-1]
+    elif sort_colors == "random":
+        # suffle array, numpy generator seeded by the random module
+        rng = np.random.default_rng(random.getrandbits(64))
+        order = order[rng.permutation(len(order))]
+
+    return colors[order]
+
+
+# packs the state of the random module into arrays
+def get_random_state():
+    version, state, gauss = random.getstate()
+    if gauss is None:
+        gauss = np.nan
+    return np.array(state, dtype=np.uint32), np.float64(gauss)
+
+
+# restores the state of the random module from get_random_state
+def set_random_state(state, gauss):
+    gauss = None if np.isnan(gauss) else float(gauss)
+    random.setstate((3, tuple(state.tolist()), gauss))
+
+
+# saves everything needed to resume a placement. The file is written
+# next to the destination and then renamed, so a checkpoint is never
+# left half written. The placement order is saved only if it's tracked
+def save_checkpoint(full_path, settings, colors, grid, filled, engine,
+                    cursor, elapsed, time_lost, last_percent, last_saved,
+                    order=None):
+    random_state, random_gauss = get_random_state()
+    extra = {} if order is None else {"order": order}
+    temp_path = f"{full_path}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, settings=json.dumps(settings), colors=colors,
+                 grid=grid, filled=filled, frontier=engine.state(),
+                 cursor=cursor, elapsed=elapsed, time_lost=time_lost,
+                 last_percent=last_percent, last_saved=last_saved,
+                 random_state=random_state, random_gauss=random_gauss,
+                 **extra)
+    os.replace(temp_path, full_path)
+
+
+# loads a checkpoint saved by save_checkpoint
+def load_checkpoint(full_path):
+    with np.load(full_path) as data:
+        checkpoint = {key: data[key] for key in data.files}
+    checkpoint["settings"] = json.loads(str(checkpoint["settings"]))
+    return checkpoint
+
+
+# saves the placement map of an image: the palette index of the color of
+# each pixel and the number of colors placed before it, as (height, width)
+# uint32 arrays
+def save_placement_map(full_path, grid, order, bits):
+    width, height = order.shape
+    indices = ColorSpace(palette(bits)).index(grid.reshape(-1, 3))
+    np.savez(full_path, bits=bits,
+             indices=indices.reshape(width, height).T.astype(np.uint32),
+             order=order.T)
+
+
+# loads a placement map saved by save_placement_map
+def load_placement_map(full_path):
+    with np.load(full_path) as data:
+        placement_map = {key: data[key] for key in data.files}
+    placement_map["bits"] = int(placement_map["bits"])
+    return placement_map
+
+
+# renders an image again from its placement map, with a different palette:
+# channels in another order (such as "bgr"), hues rotated by some degrees,
+# colors inverted or reduced to a smaller number of bits. If placed is set,
+# only the first placed pixels are shown, like in the middle of the
+# placement. The palette is changed before being copied on the pixels, so
+# this takes a fraction of a second even for big images. Returns a
+# (height, width, 3) array
+def recolor_image(placement_map, channels="rgb", hue=0, invert=False,
+                  quantize=0, placed=None):
+    colors = palette(placement_map["bits"])
+    if channels != "rgb":
+        colors = colors[:, ["rgb".index(c) for c in channels]]
+    if hue:
+        hsb = calculate_hsb(colors)
+        hsb[:, 0] = (hsb[:, 0] + hue) % 360
+        colors = hsb_to_rgb(hsb)
+    if invert:
+        colors = 255 - colors
+    if quantize:
+        # same channel steps as a palette with quantize bits
+        step = 256 // int(2 ** (quantize / 3))
+        colors = colors // step * step
+
+    pixels = np.take(colors, placement_map["indices"], axis=0)
+    if placed is not None:
+        pixels[placement_map["order"] >= placed] = 0
+    return pixels
+
+
+# places the colors on the grid one at a time, keeping everything needed
+# to continue later. The colors are sorted (or, when resuming, restored
+# from the checkpoint) when the placement is created. If order is set,
+# the number of colors placed before each pixel is written in it
+class Placement:
+    def __init__(self, grid, filled, colors, start_position, start_points,
+                 start_color, sort_colors, dist_selection, engine_name="sort",
+                 threads=1, metric="rgb", approx=0, batch=1, space=None,
+                 resume=None, keys=None, order=None):
+        self.__grid = grid
+        self.__filled = filled
+        self.__order = order
+        self.__start_position = start_position
+        self.__start_points = start_points
+        self.__batch = batch
+
+        # coordinates of the colors used to measure their distance
+        if space is None:
+            space = ColorSpace(colors, metric)
+        self.__space = space
+
+        # placement engine, keeps track of the available pixels
+        self.__engine = create_engine(grid, filled, dist_selection, space,
+                                      engine_name, threads, approx)
+
+        if resume is not None:
+            # continue from a checkpoint. Colors are already sorted
+            self.__colors = resume["colors"]
+            grid[:] = resume["grid"]
+            filled[:] = resume["filled"]
+            if order is not None and "order" in resume:
+                order[:] = resume["order"]
+            self.__engine.restore(resume["frontier"])
+            self.__cursor = int(resume["cursor"])
+            set_random_state(resume["random_state"], resume["random_gauss"])
+        else:
+            self.__colors = order_colors(colors, start_color, sort_colors,
+                                         keys)
+            self.__cursor = 0
+
+        # pixels selected by the last batch and not placed yet, last one
+        # first
+        self.__pending = []
+        # next color and its coordinates
+        self.__color = None
+        self.__coordinates = None
+
+    # total number of colors
+    def __len__(self):
+        return len(self.__colors)
+
+    # colors, in placement order
+    @property
+    def colors(self):
+        return self.__colors
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    # number of placed colors
+    @property
+    def cursor(self):
+        return self.__cursor
+
+    @property
+    def done(self):
+        return self.__cursor == len(self.__colors)
+
+    # true while the pixels selected by a batch are being placed
+    @property
+    def in_batch(self):
+        return bool(self.__pending)
+
+    # returns the best pixel for the next color
+    def select(self):
+        i = self.__cursor
+        self.__color = tuple(self.__colors[i].tolist())
+        self.__coordinates = self.__space.coordinates(self.__color)
+
+        selected_pixel = None
+        if i < self.__start_points:
+            # pick the first starting points
+            selected_pixel = start_pixel(self.__filled, i,
+                                         self.__start_position)
+
+        if selected_pixel is None and self.__batch > 1 and \
+                i >= self.__start_points:
+            if not self.__pending:
+                # pick the pixels for the next colors
+                batch_colors = [self.__space.coordinates(color) for color
+                                in self.__colors[i:i + self.__batch].tolist()]
+                self.__pending = self.__engine.select_batch(
+                    batch_colors)[::-1]
+            selected_pixel = self.__pending.pop()
+        elif selected_pixel is None:
+            selected_pixel = self.__engine.select(self.__coordinates)
+        return selected_pixel
+
+    # puts the next color on the pixel returned by select. Returns the color
+    def place(self, pos):
+        height = self.__filled.shape[1]
+        x, y = divmod(pos, height)
+        self.__grid[x, y] = self.__color
+        self.__filled[x, y] = True
+        if self.__order is not None:
+            self.__order[x, y] = self.__cursor
+        # update the available pixels
+        self.__engine.update(pos, self.__coordinates)
+        self.__cursor += 1
+        return self.__color
+
+
+# estimates the remaining time from the observed cost of placing a pixel,
+# which mostly depends on how many pixels are available
+class TimeEstimator:
+    def __init__(self):
+        # frontier size and seconds per pixel of each sample
+        self.__frontiers = []
+        self.__costs = []
+
+    # pixels placed in seconds, with a frontier of the given size
+    def add(self, pixels, seconds, frontier):
+        if pixels > 0:
+            self.__frontiers.append(frontier)
+            self.__costs.append(seconds / pixels)
+
+    # seconds needed to place pixels with a frontier of the given size.
+    # Returns None if there are no samples yet
+    def remaining(self, pixels, frontier):
+        if not self.__costs:
+            return None
+
+        # latest cost, used until the frontier has changed enough
+        cost = self.__costs[-1]
+        if len(self.__costs) >= 3 and np.ptp(self.__frontiers) > 0:
+            # linear fit of the cost against the frontier size
+            slope, intercept = np.polyfit(self.__frontiers, self.__costs, 1)
+            if intercept + slope * frontier > 0:
+                cost = intercept + slope * frontier
+        return pixels * cost
+
+
+# place pixels in grid, effectively creating the image
+def place_pixels(grid, filled, colors, start_position, start_points,
+                 start_color, sort_colors, dist_selection, progress_pics,
+                 path, filename, engine_name="sort", threads=1,
+                 checkpoint_path=None, checkpoint_interval=0, settings=None,
+                 resume=None, stream=None, samples=None, stats_file=None,
+                 metric="rgb", approx=0, batch=1, space=None, keys=None,
+                 control=None, order=None):
+    # started time
+    started = time.time()
+
+    # time spent picking pixels, updating the engine and saving files
+    timers = {"select": 0.0, "update": 0.0, "io": 0.0}
+    estimator = TimeEstimator()
+
+    # progess tracking
+    percent = 0
+    percent_interval = 1
+    last_percent = 0
+    time_lost = 0
+
+    # progress pictures tracking
+    last_saved = 0
+    if progress_pics > 0:
+        # percent intervals at which a progress has to be saved
+        save_interval = 100 / progress_pics
+        # progress pictures are saved in the background
+        writer = ImageWriter()
+    else:
+        save_interval = None
+
+    placement = Placement(grid, filled, colors, start_position,
+                          start_points, start_color, sort_colors,
+                          dist_selection, engine_name, threads, metric,
+                          approx, batch, space, resume, keys, order)
+    # colors are sorted by the placement
+    colors = placement.colors
+    engine = placement.engine
+    first = placement.cursor
+
+    if resume is not None:
+        # continue from a checkpoint
+        started -= float(resume["elapsed"])
+        time_lost = int(resume["time_lost"])
+        last_percent = float(resume["last_percent"])
+        last_saved = float(resume["last_saved"])
+        logging.info(f"resumed from color {first}/{len(colors)}")
+
+    # last time a checkpoint was saved
+    last_checkpoint = time.time()
+    # commands waiting for the end of a batch
+    checkpoint_requested = False
+    stop_requested = False
+    # placed pixels between samples
+    sample_interval = max(len(colors) // 100, 1)
+    # placed pixels and placement time at the last log
+    last_logged = first
+    last_work = 0.0
+
+    # iterate over colors
+    for i in range(first, len(colors)):
+        phase_started = time.perf_counter()
+        # pick the best pixel for the current color
+        selected_pixel = placement.select()
+
+        selected = time.perf_counter()
+        timers["select"] += selected - phase_started
+
+        # put the color on the selected pixel in the grid
+        c = placement.place(selected_pixel)
+        if stream:
+            stream.add(selected_pixel, c)
+        if samples is not None and i % sample_interval == 0:
+            # placed pixels, elapsed time and size of the engine
+            samples.append((i, time.time() - started, len(engine)))
+
+        phase_started = time.perf_counter()
+        timers["update"] += phase_started - selected
+
+        # update percent
+        percent = i / len(colors) * 100
+        # is it time to save a progress pic yet?
+        if progress_pics > 0 and percent - last_saved >= save_interval:
+            # yes it is
+            last_saved = last_percent
+            last_saved = round(percent * 4) / 4  # round to quarters
+            # .5 -> .50, (add zeroes at the and)
+            last_saved_str = format(last_saved, '.2f')
+            progress_filename = f"{filename}-progress-{last_saved_str}"
+            if isinstance(grid, np.memmap):
+                # a copy of the image might not fit in memory
+                full_path = save_image_strips(grid, path, progress_filename)
+                logging.info(f"image saved: {full_path}")
+            else:
+                image = generate_image(grid, filled)
+                logging.info(f"progress image at {last_saved_str}% "
+                             "generated")
+                writer.save(image, path, progress_filename)
+
+        # update logging
+        if percent - last_percent >= percent_interval:
+            last_percent = percent
+            # calculate elapsed time
+            elapsed_seconds = int((time.time() - started)) - time_lost
+            elapsed_minutes = int(elapsed_seconds / 60)
+            elapsed_hours = int(elapsed_minutes / 60)
+
+            # cost of the last pixels, at the current frontier size
+            work = timers["select"] + timers["update"]
+            estimator.add(i - last_logged, work - last_work, len(engine))
+            speed = (i - last_logged) / max(work - last_work, 1e-9)
+            last_logged = i
+            last_work = work
+
+            # calculate remaining time
+            remaining_seconds = estimator.remaining(len(colors) - i,
+                                                    len(engine))
+            if remaining_seconds is None:
+                # no samples yet, assume a linear progress
+                total_seconds = 100 * elapsed_seconds / percent
+                remaining_seconds = total_seconds - elapsed_seconds
+            remaining_seconds = int(remaining_seconds)
+            remaining_minutes = int(remaining_seconds / 60)
+            remaining_hours = int(remaining_minutes / 60)
+
+            # string that will be logged
+            log_string = f"progress: {int(percent)}%, elapsed: "
+
+            # stop showing plural a plural S when it's singular!
+            suffix = ""
+            # elapsed time in a correct fashion
+            if elapsed_hours > 0:
+                if elapsed_hours > 1:
+                    suffix = "s"
+                log_string += f"{elapsed_hours} hour{suffix}"
+            elif elapsed_minutes > 0:
+                if elapsed_minutes > 1:
+                    suffix = "s"
+                log_string += f"{elapsed_minutes} minute{suffix}"
+            else:
+                if elapsed_seconds > 1:
+                    suffix = "s"
+                log_string += f"{elapsed_seconds} second{suffix}"
+
+            # reset suffix
+            suffix = ""
+            log_string += ", remaining: "
+            # remaining time in a correct fashion
+            if remaining_hours > 0:
+                if remaining_hours > 1:
+                    suffix = "s"
+                log_string += f"{remaining_hours} hour{suffix}"
+            elif remaining_minutes > 0:
+                if remaining_minutes > 1:
+                    suffix = "s"
+                log_string += f"{remaining_minutes} minute{suffix}"
+            else:
+                if remaining_seconds > 1:
+                    suffix = "s"
+                log_string += f"{remaining_seconds} second{suffix}"
+
+            # it's time to log!
+            logging.info(log_string)
+
+            if stats_file:
+                # machine readable progress, one json object per line
+                stats_file.write(json.dumps({
+                    "placed": i,
+                    "percent": round(percent, 2),
+                    "elapsed": round(time.time() - started - time_lost, 3),
+                    "remaining": remaining_seconds,
+                    "frontier": len(engine),
+                    "pixels_per_second": round(speed, 2),
+                    "phases": {k: round(v, 3) for k, v in timers.items()},
+                }) + "\n")
+                stats_file.flush()
+
+            if control is not None:
+                control.status = log_string
+
+        # commands sent to the script, a single check for each pixel
+        if control is not None and control.pending:
+            commands = control.receive()
+            if control.paused:
+                logging.info("script paused")
+                pause_started = time.time()
+                # commands sent during the pause are handled afterwards
+                commands += control.wait()
+                current_lost = int(time.time() - pause_started)
+                time_lost += current_lost
+                logging.info(f"script resumed. The script was paused for "
+                             f"{current_lost} seconds.")
+                # the pause is not part of the placement
+                phase_started = time.perf_counter()
+
+            if "snapshot" in commands:
+                snapshot_filename = f"{filename}-snapshot-{i + 1}"
+                if isinstance(grid, np.memmap):
+                    full_path = save_image_strips(grid, path,
+                                                  snapshot_filename)
+                else:
+                    full_path = save_image(generate_image(grid, filled),
+                                           path, snapshot_filename)
+                logging.info(f"snapshot saved: {full_path}")
+            if "checkpoint" in commands:
+                checkpoint_requested = True
+            if "stop" in commands:
+                # the placement can be resumed from the checkpoint
+                checkpoint_requested = True
+                stop_requested = True
+
+        # is it time to save a checkpoint? Not in the middle of a batch
+        if not placement.in_batch and (checkpoint_requested or (
+                checkpoint_interval > 0 and
+                time.time() - last_checkpoint >= checkpoint_interval)):
+            if stream:
+                # the stream must contain everything before the checkpoint
+                stream.flush()
+            save_checkpoint(checkpoint_path, settings, colors, grid, filled,
+                            engine, i + 1, time.time() - started, time_lost,
+                            last_percent, last_saved, order)
+            last_checkpoint = time.time()
+            checkpoint_requested = False
+            logging.info(f"checkpoint saved: {checkpoint_path}")
+
+        timers["io"] += time.perf_counter() - phase_started
+
+        if stop_requested and not placement.in_batch:
+            logging.info(f"placement stopped at color {i + 1}/"
+                         f"{len(colors)}")
+            control.stopped = True
+            break
+
+    if progress_pics > 0:
+        # wait for the last progress pictures
+        writer.close()
+
+    if approx:
+        checks, misses, error = engine.approx_quality()
+        if checks:
+            logging.info(f"approximate selection: {misses}/{checks} "
+                         f"sampled pixels ({misses / checks * 100:.1f}%) "
+                         "differ from the exact selection, on average by "
+                         f"{error:.2f} in color distance")
+
+    # elapsed time in seconds
+    seconds = int((time.time() - started))
+    return grid, seconds, time_lost
+
+
+# splits the grid among the starting pixels: each pixel belongs to the
+# region of the closest one. Returns the region of each pixel and the seam,
+# the pixels closer than seam pixels to another region
+def split_regions(width, height, starts, seam=1):
+    sx, sy = np.divmod(np.array(starts), height)
+    labels = np.empty((width, height), dtype=np.int32)
+    ys = np.arange(height)[:, np.newaxis]
+    # (columns, height, starts) distances are kept small
+    columns = max((1 << 22) // (height * len(starts)), 1)
+    for start in range(0, width, columns):
+        xs = np.arange(start, min(start + columns, width))
+        distances = (xs[:, np.newaxis, np.newaxis] - sx) ** 2 + \
+            (ys - sy) ** 2
+        labels[xs] = distances.argmin(axis=2)
+
+    seams = np.zeros((width, height), dtype=bool)
+    for dx in range(-seam, seam + 1):
+        for dy in range(-seam, seam + 1):
+            # pixels and their neighbors dx, dy away
+            pixels = (slice(max(-dx, 0), width - max(dx, 0)),
+                      slice(max(-dy, 0), height - max(dy, 0)))
+            neighbors = (slice(max(dx, 0), width + min(dx, 0)),
+                         slice(max(dy, 0), height + min(dy, 0)))
+            seams[pixels] |= labels[pixels] != labels[neighbors]
+    # starting pixels always grow their region
+    seams[sx, sy] = False
+    return labels, seams
+
+
+# grows a region from its starting pixel, in its own process. The grid is
+# shared by all the regions; pixels outside the region are marked as filled
+# for the engine, so it never reaches them. The shared progress holds, for
+# each placed pixel, the number of colors of the region placed before it
+# plus one (0 for empty pixels). Returns the colors that could not be
+# placed and the placement time
+def grow_region(grid_name, progress_name, shape, region, colors, start,
+                bits, dist_selection, engine_name, threads, metric, approx,
+                cache_dir, seed):
+    started = time.time()
+    random.seed(seed)
+    grid_memory = shared_memory.SharedMemory(name=grid_name)
+    progress_memory = shared_memory.SharedMemory(name=progress_name)
+    grid = np.ndarray(shape, dtype=np.uint8, buffer=grid_memory.buf)
+    progress = np.ndarray(shape[:2], dtype=np.uint32,
+                          buffer=progress_memory.buf)
+
+    filled = ~region
+    space = color_space(bits, metric, cache_dir)
+    engine = create_engine(grid, filled, dist_selection, space, engine_name,
+                           threads, approx)
+
+    height = shape[1]
+    pos = start
+    placed = 0
+    for color in colors.tolist():
+        coordinates = space.coordinates(color)
+        if placed > 0:
+            if not len(engine):
+                # the rest of the region can't be reached
+                break
+            pos = engine.select(coordinates)
+        x, y = divmod(pos, height)
+        grid[x, y] = color
+        filled[x, y] = True
+        engine.update(pos, coordinates)
+        placed += 1
+        progress[x, y] = placed
+
+    del grid, progress
+    grid_memory.close()
+    progress_memory.close()
+    return colors[placed:], time.time() - started
+
+
+# places the colors growing the region around each starting pixel in its
+# own process, then places the colors left along the seams between the
+# regions. Each region gets the colors of a range of hues, so that it's
+# not left with a sparse sample of the whole palette; the seam gets colors
+# evenly spread among all of them. The same seed gives the same image
+# regardless of the number of processes. Needs the tree or the vector
+# engine, the only ones that don't look at the neighbors of the available
+# pixels on the grid. If order is set, the regions are ordered as if they
+# had grown at the same speed, followed by the seams
+def place_regions(grid, filled, colors, start_position, start_points,
+                  start_color, sort_colors, dist_selection,
+                  engine_name="vector", threads=1, metric="rgb", approx=0,
+                  cache_dir=None, space=None, keys=None, processes=None,
+                  seam=1, order=None):
+    started = time.time()
+    width, height = filled.shape
+    bits = len(colors).bit_length() - 1
+    if space is None:
+        space = color_space(bits, metric, cache_dir)
+
+    # starting pixels, duplicates are skipped
+    starts = []
+    taken = np.zeros_like(filled)
+    for i in range(start_points):
+        pos = start_pixel(taken, i, start_position)
+        if pos is not None:
+            taken.flat[pos] = True
+            starts.append(pos)
+
+    labels, seams = split_regions(width, height, starts, seam)
+    sizes = np.bincount(labels[~seams], minlength=len(starts))
+    logging.info(f"{len(starts)} regions, {sizes.min()} to {sizes.max()} "
+                 f"pixels each, {seams.sum()} seam pixels")
+
+    colors = order_colors(colors, start_color, sort_colors, keys)
+    # the start color is left to the regions
+    seam_colors = np.linspace(1, len(colors), seams.sum(),
+                              endpoint=False).astype(np.int64)
+    # each region gets a range of hues, still in the sorted order
+    rest = np.delete(colors, seam_colors, axis=0)
+    hues = np.argsort(calculate_hsb(rest)[:, 0], kind="stable")
+    chunks = [rest[np.sort(chunk)]
+              for chunk in np.split(hues, np.cumsum(sizes)[:-1])]
+    seeds = [random.getrandbits(64) for _ in starts]
+
+    grid_memory = shared_memory.SharedMemory(create=True, size=grid.nbytes)
+    progress_memory = shared_memory.SharedMemory(create=True,
+                                                 size=filled.size * 4)
+    try:
+        shared_grid = np.ndarray(grid.shape, dtype=np.uint8,
+                                 buffer=grid_memory.buf)
+        progress = np.ndarray(filled.shape, dtype=np.uint32,
+                              buffer=progress_memory.buf)
+        progress[:] = 0
+
+        leftovers = [colors[seam_colors]]
+        processes = min(processes or os.cpu_count(), len(starts))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(grow_region, grid_memory.name,
+                                       progress_memory.name, grid.shape,
+                                       (labels == r) & ~seams, chunks[r],
+                                       starts[r], bits, dist_selection,
+                                       engine_name, threads, metric, approx,
+                                       cache_dir, seeds[r])
+                       for r in range(len(starts))]
+            for r, future in enumerate(futures):
+                left, seconds = future.result()
+                logging.info(f"region {r + 1}/{len(starts)}: "
+                             f"{sizes[r] - len(left)} pixels placed in "
+                             f"{seconds:.1f} seconds")
+                leftovers.append(left)
+
+        grid[:] = shared_grid
+        filled[:] = progress > 0
+        if order is not None:
+            # pixels sorted by the progress of their region
+            placed = np.flatnonzero(filled)
+            done = progress.flat[placed] / np.array(
+                [len(c) for c in chunks])[labels.flat[placed]]
+            order.flat[placed[np.argsort(done, kind="stable")]] = \
+                np.arange(len(placed))
+        del shared_grid, progress
+    finally:
+        grid_memory.close()
+        grid_memory.unlink()
+        progress_memory.close()
+        progress_memory.unlink()
+
+    # the seam pass starts from every empty pixel next to a placed one
+    leftovers = np.concatenate(leftovers)
+    padded = np.pad(filled, 1)
+    around = np.zeros_like(filled)
+    for dx in range(3):
+        for dy in range(3):
+            around |= padded[dx:dx + width, dy:dy + height]
+    engine = create_engine(grid, filled, dist_selection, space, engine_name,
+                           threads, approx)
+    engine.restore(np.flatnonzero(around & ~filled))
+
+    seam_started = time.time()
+    cursor = len(colors) - len(leftovers)
+    for color in leftovers.tolist():
+        coordinates = space.coordinates(color)
+        pos = engine.select(coordinates)
+        x, y = divmod(pos, height)
+        grid[x, y] = color
+        filled[x, y] = True
+        if order is not None:
+            order[x, y] = cursor
+            cursor += 1
+        engine.update(pos, coordinates)
+    logging.info(f"seams: {len(leftovers)} pixels placed in "
+                 f"{time.time() - seam_started:.1f} seconds")
+
+    seconds = int(time.time() - started)
+    return grid, seconds, 0
+
+
+# generates the image by dumping the grid into a png
+def generate_image(grid, filled, default_color=(0, 0, 0)):
+    pixels = grid
+    if any(default_color):
+        # fill with default color if empty (empty cells are already black)
+        pixels = np.where(filled[:, :, np.newaxis], grid,
+                          np.array(default_color, dtype=np.uint8))
+    # the grid is indexed by x first, the image by y first. PIL copies the
+    # buffer once and then swaps the axes
+    image = Image.fromarray(pixels, "RGB")
+    return image.transpose(Image.Transpose.TRANSPOSE)
+
+
+# zlib strategies for png compression. PIL uses filtered by default
+PNG_STRATEGIES = {
+    "filtered": zlib.Z_FILTERED,
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+
+# full path of an image file
+def image_path(path, filename, image_format="png"):
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return f"{path}/{filename}.{image_format}"
+    return f"{filename}.{image_format}"
+
+
+# save image to file. The image is a PIL image or a (height, width, 3)
+# array. Formats are png, webp (lossless) and npy (the raw array). The
+# compression goes from 0 (fastest) to 9 (smallest file)
+def save_image(image, path, filename, image_format="png", compression=6,
+               strategy="filtered"):
+    full_path = image_path(path, filename, image_format)
+    if image_format == "npy":
+        np.save(full_path, np.asarray(image))
+        return full_path
+
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image, "RGB")
+    if image_format == "webp":
+        # method goes from 0 to 6
+        image.save(full_path, lossless=True, quality=100,
+                   method=compression * 6 // 9)
+    else:
+        image.save(full_path, compress_level=compression,
+                   compress_type=PNG_STRATEGIES[strategy])
+    return full_path
+
+
+# writes a png chunk
+def write_png_chunk(f, chunk_type, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+# saves the grid as png, strip_rows rows at a time, without building the
+# whole image in memory. Used when the grid is memory mapped (empty cells
+# are already black)
+def save_image_strips(grid, path, filename, strip_rows=256, compression=6,
+                      strategy="filtered"):
+    full_path = image_path(path, filename)
+
+    width, height = grid.shape[:2]
+    compressor = zlib.compressobj(compression, zlib.DEFLATED, zlib.MAX_WBITS,
+                                  zlib.DEF_MEM_LEVEL,
+                                  PNG_STRATEGIES[strategy])
+    with open(full_path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, truecolor, not interlaced
+        header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        write_png_chunk(f, b"IHDR", header)
+        for y in range(0, height, strip_rows):
+            strip = np.ascontiguousarray(
+                grid[:, y:y + strip_rows].transpose(1, 0, 2))
+            # every row starts with its filter type, 1 (sub): each byte is
+            # stored as the difference from the same channel of the pixel
+            # on its left
+            rows = np.empty((len(strip), width * 3 + 1), dtype=np.uint8)
+            rows[:, 0] = 1
+            rows[:, 1:4] = strip[:, 0]
+            rows[:, 4:] = (strip[:, 1:] - strip[:, :-1]).reshape(
+                len(strip), -1)
+            data = compressor.compress(rows.tobytes())
+            if data:
+                write_png_chunk(f, b"IDAT", data)
+        write_png_chunk(f, b"IDAT", compressor.flush())
+        write_png_chunk(f, b"IEND", b"")
+    return full_path
+
+
+# saves images on a background thread, so the placement doesn't wait for
+# the png compression. Once size images are waiting, save() blocks.
+# Files in remove are deleted once the image is saved
+class ImageWriter:
+    def __init__(self, size=4):
+        self.__queue = queue.Queue(maxsize=size)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                # writer closed
+                return
+
+            image, path, filename, remove, options = item
+            try:
+                full_path = save_image(image, path=path, filename=filename,
+                                       **options)
+                logging.info(f"image saved: {full_path}")
+            except Exception:
+                logging.exception(f"could not save image {filename}")
+                continue
+
+            for remove_path in remove:
+                Path(remove_path).unlink(missing_ok=True)
+
+    # queue an image to be saved, options are passed to save_image
+    def save(self, image, path, filename, remove=(), **options):
+        self.__queue.put((image, path, filename, remove, options))
+
+    # wait until all the queued images are saved
+    def close(self):
+        self.__queue.put(None)
+        self.__thread.join()
+
+
+# checks that a control socket can be created at socket_path: anything
+# already there must be a socket, left by a previous run. Raises ValueError
+# otherwise, so other files are never deleted
+def check_socket_path(socket_path):
+    if Path(socket_path).exists() and \
+            not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        raise ValueError(f"{socket_path} already exists and is not a socket")
+
+
+# commands for a running placement: pause, resume (or toggle, to switch
+# between the two), snapshot (save the image as it is), checkpoint and stop
+# (save a checkpoint and exit). They can come from signals, from a unix
+# socket and from the PAUSE file, and are checked by place_pixels once
+# for each pixel through pending
+class Control:
+    COMMANDS = ["pause", "resume", "toggle", "snapshot", "checkpoint",
+                "stop"]
+
+    def __init__(self):
+        # true when there are commands to handle
+        self.pending = False
+        self.paused = False
+        # set by place_pixels when it stops before placing every color
+        self.stopped = False
+        # last progress, returned by the status command of the socket
+        self.status = "starting"
+        # put() can be called from signal handlers
+        self.__queue = queue.SimpleQueue()
+        self.__closed = threading.Event()
+        self.__signals = {}
+        self.__server = None
+        self.__socket_path = None
+
+    # sends a command, from any thread
+    def send(self, command):
+        self.__queue.put(command)
+        self.pending = True
+
+    # updates the pause state, returns the other commands
+    def __handle(self, command):
+        if command == "pause":
+            self.paused = True
+        elif command == "resume":
+            self.paused = False
+        elif command == "toggle":
+            self.paused = not self.paused
+        else:
+            return [command]
+        return []
+
+    # commands sent since the last call
+    def receive(self):
+        # cleared first, so commands sent meanwhile are not lost
+        self.pending = False
+        commands = []
+        while True:
+            try:
+                commands += self.__handle(self.__queue.get_nowait())
+            except queue.Empty:
+                return commands
+
+    # waits until the placement is resumed or stopped, returns the
+    # commands sent in the meantime
+    def wait(self):
+        commands = []
+        while self.paused and "stop" not in commands:
+            try:
+                # timeout, so that signals are handled while waiting
+                commands += self.__handle(self.__queue.get(timeout=1))
+            except queue.Empty:
+                pass
+        self.pending = not self.__queue.empty()
+        return commands
+
+    # SIGUSR1 pauses and resumes, SIGUSR2 saves a snapshot and a checkpoint
+    # and SIGTERM stops. Signals can only be handled by the main thread
+    def listen_signals(self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        handlers = {
+            "SIGUSR1": ["toggle"],
+            "SIGUSR2": ["snapshot", "checkpoint"],
+            "SIGTERM": ["stop"],
+        }
+        for name, commands in handlers.items():
+            # not every signal is available on every system
+            if hasattr(signal, name):
+                number = getattr(signal, name)
+                self.__signals[number] = signal.signal(
+                    number, lambda *_, commands=commands:
+                    [self.send(c) for c in commands])
+
+    # accepts commands from a unix socket, one for each line. Each command
+    # is answered with ok, status with the last logged progress
+    def listen_socket(self, socket_path):
+        check_socket_path(socket_path)
+        if Path(socket_path).exists():
+            # left by a previous run
+            Path(socket_path).unlink()
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(socket_path)
+        self.__server.listen()
+        self.__socket_path = socket_path
+        threading.Thread(target=self.__serve, daemon=True).start()
+
+    def __serve(self):
+        while True:
+            try:
+                connection, _ = self.__server.accept()
+            except OSError:
+                # socket closed
+                return
+
+            with connection, connection.makefile("rw") as f:
+                for line in f:
+                    command = line.strip()
+                    if command == "status":
+                        f.write(f"{self.status}\n")
+                    elif command in self.COMMANDS:
+                        self.send(command)
+                        f.write("ok\n")
+                    else:
+                        f.write(f"unknown command: {command}\n")
+                    f.flush()
+
+    # pauses while a file (PAUSE, in the working folder) exists
+    def watch_file(self, pause_path="PAUSE", interval=1):
+        threading.Thread(target=self.__watch, args=(pause_path, interval),
+                         daemon=True).start()
+
+    def __watch(self, pause_path, interval):
+        file_paused = False
+        while not self.__closed.wait(interval):
+            exists = Path(pause_path).is_file()
+            if exists != file_paused:
+                file_paused = exists
+                self.send("pause" if exists else "resume")
+
+    # stops listening and restores the previous signal handlers
+    def close(self):
+        self.__closed.set()
+        for number, handler in self.__signals.items():
+            signal.signal(number, handler)
+        self.__signals = {}
+        if self.__server:
+            self.__server.close()
+            Path(self.__socket_path).unlink(missing_ok=True)
+            self.__server = None
+
+
+# writes the canvas as raw rgb24 video frames, one every frame_pixels
+# placed pixels. It can be converted with ffmpeg, without saving any png
+class FrameStream:
+    def __init__(self, full_path, grid, frame_pixels, start=0):
+        self.__grid = grid
+        self.__frame_pixels = frame_pixels
+        # number of placed pixels
+        self.__count = start
+        self.__frame_size = grid.size
+        self.__file = open_stream(full_path,
+                                  start // frame_pixels * self.__frame_size)
+        if self.__file is None:
+            # the frames before the checkpoint are lost
+            self.__file = open_stream(full_path, 0)
+
+    def __write(self):
+        # frames are stored row by row
+        self.__file.write(self.__grid.transpose(1, 0, 2).tobytes())
+
+    # a pixel has been placed
+    def add(self, pos, color):
+        self.__count += 1
+        if self.__count % self.__frame_pixels == 0:
+            self.__write()
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        if self.__count % self.__frame_pixels != 0:
+            # last, incomplete, frame
+            self.__write()
+        self.__file.close()
+
+
+# writes every placement as a (position, color) record. The placement can
+# then be replayed by replay_delta at any frame rate
+class DeltaLog:
+    MAGIC = b"ECDELTA1"
+    # position packed as x * height + y, and its color
+    DTYPE = np.dtype([("pos", "<u4"), ("color", "u1", 3)])
+
+    def __init__(self, full_path, width, height, start=0,
+                 buffer_size=65536):
+        self.__file = None
+        if start > 0:
+            # header and the records placed before the checkpoint
+            size = len(self.MAGIC) + 8 + start * self.DTYPE.itemsize
+            self.__file = open_stream(full_path, size)
+        if self.__file is None:
+            # new log, or the records before the checkpoint are lost
+            self.__file = open_stream(full_path, 0)
+            self.__file.write(self.MAGIC)
+            self.__file.write(np.array([width, height], "<u4").tobytes())
+        # records are written in chunks
+        self.__buffer = np.empty(buffer_size, dtype=self.DTYPE)
+        self.__count = 0
+
+    # a pixel has been placed
+    def add(self, pos, color):
+        self.__buffer[self.__count] = (pos, color)
+        self.__count += 1
+        if self.__count == len(self.__buffer):
+            self.flush()
+
+    def flush(self):
+        self.__file.write(self.__buffer[:self.__count].tobytes())
+        self.__count = 0
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        self.__file.close()
+
+
+# opens a stream file. When resuming, whatever was written after the
+# checkpoint (the first size bytes) is dropped. Returns None if the file
+# is missing or shorter than size, so it can't be resumed and has to be
+# started again
+def open_stream(full_path, size):
+    if size == 0:
+        return open(full_path, "wb")
+    if not Path(full_path).is_file() or \
+            Path(full_path).stat().st_size < size:
+        logging.warning(f"{full_path} is missing or incomplete, it only "
+                        "holds the placement from the checkpoint on")
+        return None
+    f = open(full_path, "r+b")
+    f.truncate(size)
+    f.seek(size)
+    return f
+
+
+# renders a delta log into raw rgb24 frames, one every frame_pixels
+# placed pixels. Returns the frame size
+def replay_delta(delta_path, full_path, frame_pixels):
+    with open(delta_path, "rb") as f:
+        if f.read(len(DeltaLog.MAGIC)) != DeltaLog.MAGIC:
+            raise ValueError(f"{delta_path} is not a delta log")
+        width, height = np.frombuffer(f.read(8), dtype="<u4").tolist()
+        records = np.frombuffer(f.read(), dtype=DeltaLog.DTYPE)
+
+    # frames are stored row by row, positions are x * height + y
+    frame = np.zeros((width * height, 3), dtype=np.uint8)
+    with open(full_path, "wb") as f:
+        for start in range(0, len(records), frame_pixels):
+            chunk = records[start:start + frame_pixels]
+            frame[chunk["pos"]] = chunk["color"]
+            f.write(frame.reshape(width, height, 3)
+                    .transpose(1, 0, 2).tobytes())
+    return width, height
+
+
+# generates a single image and saves it, returns the saved path.
+# Runs in the worker processes when more than one worker is used
+def render_image(bits, seed, path, filename, start_position, start_points,
+                 start_color, sort_colors, dist_selection, progress_pics,
+                 engine_name, threads, stream=None, frame_pixels=1000,
+                 checkpoint_interval=0, resume=None, stats=False,
+                 profile=False, metric="rgb", memmap=False, approx=0,
+                 batch=1, cache_dir=None, control_path=None,
+                 image_format="png", compression=6, strategy="filtered",
+                 coarse=0, regions=False, placement_map=False,
+                 writer=None):
+    # everything needed to generate the image again, saved in checkpoints
+    settings = {
+        "bits": bits,
+        "seed": seed,
+        "path": path,
+        "filename": filename,
+        "start_position": start_position,
+        "start_points": start_points,
+        "start_color": start_color,
+        "sort_colors": sort_colors,
+        "dist_selection": dist_selection,
+        "progress_pics": progress_pics,
+        "engine_name": engine_name,
+        "threads": threads,
+        "stream": stream,
+        "frame_pixels": frame_pixels,
+        "metric": metric,
+        "memmap": memmap,
+        "approx": approx,
+        "batch": batch,
+        "cache_dir": cache_dir,
+        "image_format": image_format,
+        "compression": compression,
+        "strategy": strategy,
+        "coarse": coarse,
+        "regions": regions,
+        "placement_map": placement_map,
+        "checkpoint_interval": checkpoint_interval,
+    }
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        base_path = f"{path}/{filename}"
+    else:
+        base_path = filename
+    checkpoint_path = f"{base_path}-checkpoint.npz"
+    canvas_path = f"{base_path}-canvas.npy" if memmap else None
+
+    # every image is seeded on its own, so it can be generated again alone
+    random.seed(seed)
+    # with coarse, colors are placed on a smaller image, refined later
+    placed_bits = coarse if coarse else bits
+    width, height = calculate_size(placed_bits)
+
+    colors = palette(placed_bits, cache_dir)
+    keys = sort_keys(placed_bits, sort_colors, cache_dir)
+    space = color_space(placed_bits, metric, cache_dir)
+    logging.info(f"{filename}: colors generated")
+
+    grid, filled = generate_grid(width, height,
+                                 None if coarse else canvas_path)
+    logging.info(f"{filename}: empty image grid generated")
+    # placement order of each pixel, saved in the placement map
+    order = None
+    if placement_map:
+        order = np.zeros((width, height), dtype=np.uint32)
+
+    # when resuming, streams continue from the checkpoint
+    start = 0 if resume is None else int(resume["cursor"])
+    if stream == "rgb":
+        stream_path = f"{base_path}.rgb"
+        stream_writer = FrameStream(stream_path, grid, frame_pixels, start)
+    elif stream == "delta":
+        stream_path = f"{base_path}.delta"
+        stream_writer = DeltaLog(stream_path, width, height, start)
+    else:
+        stream_writer = None
+
+    if stats:
+        # progress as json lines, appended to when resuming
+        stats_path = f"{base_path}-stats.jsonl"
+        stats_file = open(stats_path, "w" if resume is None else "a")
+    else:
+        stats_file = None
+
+    # commands from signals, the PAUSE file and the control socket. Regions
+    # are placed all at once, without commands
+    control = Control()
+    if not regions:
+        control.listen_signals()
+        control.watch_file()
+    if control_path and not regions:
+        control.listen_socket(control_path)
+        logging.info(f"{filename}: listening for commands on "
+                     f"{control_path}")
+    if not regions:
+        logging.info(f"{filename}: process id {os.getpid()}, send SIGUSR1 "
+                     "to pause and resume, SIGUSR2 for a snapshot and "
+                     "SIGTERM to stop")
+
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if regions:
+        colored_grid, seconds, lost = place_regions(grid, filled, colors,
+                                                    start_position,
+                                                    start_points,
+                                                    start_color, sort_colors,
+                                                    dist_selection,
+                                                    engine_name, threads,
+                                                    metric, approx,
+                                                    cache_dir, space, keys,
+                                                    order=order)
+    else:
+        colored_grid, seconds, lost = place_pixels(grid, filled, colors,
+                                                   start_position,
+                                                   start_points, start_color,
+                                                   sort_colors,
+                                                   dist_selection,
+                                                   progress_pics, path,
+                                                   filename, engine_name,
+                                                   threads, checkpoint_path,
+                                                   checkpoint_interval,
+                                                   settings, resume,
+                                                   stream_writer,
+                                                   stats_file=stats_file,
+                                                   metric=metric,
+                                                   approx=approx, batch=batch,
+                                                   space=space, keys=keys,
+                                                   control=control,
+                                                   order=order)
+    control.close()
+
+    if profile:
+        profiler.disable()
+        profile_path = f"{base_path}.prof"
+        profiler.dump_stats(profile_path)
+        logging.info(f"{filename}: profile saved: {profile_path}")
+    if stats_file:
+        stats_file.close()
+        logging.info(f"{filename}: stats saved: {stats_path}")
+
+    if stream_writer:
+        stream_writer.close()
+        logging.info(f"{filename}: {stream} stream saved: {stream_path}")
+        if stream == "rgb":
+            logging.info(f"{filename}: convert it with ffmpeg -f rawvideo "
+                         f"-pix_fmt rgb24 -s {width}x{height} -r 25 "
+                         f"-i {stream_path} {base_path}.mp4")
+
+    if control.stopped:
+        logging.info(f"{filename}: stopped, continue with --resume "
+                     f"{checkpoint_path}")
+        if memmap:
+            del grid, colored_grid
+            Path(canvas_path).unlink(missing_ok=True)
+        return None
+
+    logging.info(f"{filename}: pixel placing completed! It took {seconds} "
+                 f"seconds. Total effective time: {seconds - lost} seconds. "
+                 f"Total paused time: {lost} seconds.")
+    speed = round((width * height) / max(seconds, 1), 2)
+    logging.info(f"{filename}: average speed: {speed} pixels per second")
+
+    if coarse:
+        refine_started = time.time()
+        colored_grid, order = refine_image(colored_grid, coarse, bits,
+                                           canvas_path, order)
+        logging.info(f"{filename}: image refined from {coarse} to {bits} "
+                     f"bits in {time.time() - refine_started:.2f} seconds")
+
+    if placement_map:
+        map_path = f"{base_path}-map.npz"
+        save_placement_map(map_path, colored_grid, order, bits)
+        logging.info(f"{filename}: placement map saved: {map_path}")
+
+    # the image is saved from a (height, width, 3) array. A memory mapped
+    # canvas is already laid out this way, and is not copied
+    pixels = np.ascontiguousarray(colored_grid.transpose(1, 0, 2))
+    options = {
+        "image_format": image_format,
+        "compression": compression,
+        "strategy": strategy,
+    }
+    if writer and not memmap:
+        # saved while the next image is placed. The checkpoint is not
+        # needed anymore once the image is saved
+        writer.save(pixels, path, filename, remove=[checkpoint_path],
+                    **options)
+        return image_path(path, filename, image_format)
+
+    if memmap and image_format == "png":
+        full_path = save_image_strips(colored_grid, path, filename,
+                                      compression=compression,
+                                      strategy=strategy)
+    else:
+        full_path = save_image(pixels, path, filename, **options)
+
+    # the checkpoint and the canvas are not needed anymore
+    if Path(checkpoint_path).is_file():
+        Path(checkpoint_path).unlink()
+    if memmap:
+        del grid, colored_grid, pixels
+        Path(canvas_path).unlink()
+    return full_path
+
+
+# generates images from python code, one step at a time:
+#
+#   generator = EveryColor(bits=12, seed="example")
+#   while not generator.done:
+#       generator.step(1000)
+#       print(generator.progress)
+#   pixels = generator.snapshot()
+#
+# Settings are the same as the command line ones. The same seed and
+# settings generate the same image as the script. Generators can be
+# configured again for a new image; palettes are generated only once for
+# each bit depth. Each generator keeps its own random state, so more than
+# one can be stepped in turns
+class EveryColor:
+    def __init__(self, bits=15, **settings):
+        self.configure(bits, **settings)
+
+    # starts a new image
+    def configure(self, bits=15, seed=None, start_position="center",
+                  start_points=1, start_color="random",
+                  sort_colors="random", dist_selection="min",
+                  engine_name="vector", threads=1, metric="rgb", approx=0,
+                  batch=1, cache_dir=None):
+        check_settings({
+            "bits": bits,
+            "start_position": start_position,
+            "start_points": start_points,
+            "start_color": start_color,
+            "sort_colors": sort_colors,
+            "dist_selection": dist_selection,
+            "engine_name": engine_name,
+            "threads": threads,
+            "metric": metric,
+            "approx": approx,
+            "batch": batch,
+        })
+        if seed is None:
+            seed = str(time.time())
+        self.__bits = bits
+        self.__seed = seed
+
+        width, height = calculate_size(bits)
+        self.__grid, self.__filled = generate_grid(width, height)
+
+        # the random state of the caller is left untouched
+        state = random.getstate()
+        random.seed(seed)
+        self.__placement = Placement(self.__grid, self.__filled,
+                                     palette(bits, cache_dir),
+                                     start_position, start_points,
+                                     start_color, sort_colors,
+                                     dist_selection, engine_name, threads,
+                                     metric, approx, batch,
+                                     color_space(bits, metric, cache_dir),
+                                     keys=sort_keys(bits, sort_colors,
+                                                    cache_dir))
+        self.__random_state = random.getstate()
+        random.setstate(state)
+
+    @property
+    def bits(self):
+        return self.__bits
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    # image size, as (width, height)
+    @property
+    def size(self):
+        return self.__filled.shape
+
+    # number of placed colors
+    @property
+    def placed(self):
+        return self.__placement.cursor
+
+    # total number of colors
+    @property
+    def total(self):
+        return len(self.__placement)
+
+    # placed colors, from 0 to 1
+    @property
+    def progress(self):
+        return self.placed / self.total
+
+    @property
+    def done(self):
+        return self.__placement.done
+
+    # places the next n colors (less if the image is done). Returns the
+    # number of placed colors
+    def step(self, n=1):
+        state = random.getstate()
+        random.setstate(self.__random_state)
+        placed = 0
+        while placed < n and not self.__placement.done:
+            self.__placement.place(self.__placement.select())
+            placed += 1
+        self.__random_state = random.getstate()
+        random.setstate(state)
+        return placed
+
+    # places all the remaining colors. Returns the image as by snapshot
+    def run(self):
+        self.step(self.total)
+        return self.snapshot()
+
+    # copy of the image, as a (height, width, 3) array. Empty pixels are
+    # black
+    def snapshot(self):
+        return self.__grid.transpose(1, 0, 2).copy()
+
+    # the image, as a PIL image
+    def image(self):
+        return generate_image(self.__grid, self.__filled)
+
+    # saves the image, returns the saved path. Options are the same as
+    # save_image (format, compression and png strategy)
+    def save(self, path, filename, **options):
+        return save_image(self.snapshot(), path, filename, **options)
+
+
+# settings of a tile that can be set in a composition layout
+TILE_SETTINGS = ["bits", "seed", "start_position", "start_points",
+                 "start_color", "sort_colors", "dist_selection", "metric",
+                 "engine_name", "approx", "batch"]
+
+
+# loads a composition layout, a json object such as:
+#
+#   {"columns": 2, "rows": 2, "gap": 4,
+#    "tiles": [{"bits": 15, "sort_colors": "hue"}, {"seed": "tile"}]}
+#
+# Tiles are listed a row at a time, each with its own settings (any of
+# TILE_SETTINGS), the missing ones are taken from defaults. Tiles missing
+# from the list (up to columns * rows) only use the defaults. Tiles without
+# a seed get "<default seed>-<tile number>", the same as the images
+# generated with --number. Returns the settings of every tile, the number
+# of columns and the gap between the tiles in pixels. Raises ValueError if
+# the layout or the settings of a tile are not valid
+def load_layout(layout_path, defaults):
+    with open(layout_path) as f:
+        layout = json.load(f)
+    if not isinstance(layout, dict):
+        raise ValueError("the layout must be a json object")
+
+    listed = layout.get("tiles", [])
+    if not isinstance(listed, list):
+        raise ValueError("tiles must be a list")
+    for x, tile in enumerate(listed):
+        if not isinstance(tile, dict):
+            raise ValueError(f"tile {x+1} must be a json object, not "
+                             f"{tile!r}")
+
+    # smallest value of the integer settings of the layout. rows default
+    # to as many as the listed tiles need
+    minimums = {"columns": 1, "rows": 1, "gap": 0}
+    values = {"columns": 1, "gap": 0, **layout}
+    for name, minimum in minimums.items():
+        if name == "rows":
+            values.setdefault("rows", -(-len(listed) // values["columns"]))
+        value = values[name]
+        if not isinstance(value, int) or isinstance(value, bool) or \
+                value < minimum:
+            raise ValueError(f"{name} must be an integer of at least "
+                             f"{minimum}, not {value!r}")
+    columns, rows = values["columns"], values["rows"]
+    if len(listed) > columns * rows:
+        raise ValueError(f"{len(listed)} tiles don't fit in {columns} "
+                         f"columns and {rows} rows")
+
+    tiles = []
+    for x in range(columns * rows):
+        tile = listed[x] if x < len(listed) else {}
+        unknown = set(tile) - set(TILE_SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown settings in tile {x+1}: "
+                             f"{', '.join(sorted(unknown))}")
+        settings = {**defaults, "seed": f"{defaults['seed']}-{x+1}", **tile}
+        try:
+            check_settings(settings)
+        except ValueError as e:
+            raise ValueError(f"tile {x+1}: {e}")
+        tiles.append(settings)
+    return tiles, columns, values["gap"]
+
+
+# places the colors of a tile and copies it in its place inside the
+# composition, an image shared by all the tiles. Returns the placement time
+def render_tile(buffer_name, shape, settings, x, y, cache_dir=None):
+    started = time.time()
+    pixels = EveryColor(**settings, cache_dir=cache_dir).run()
+
+    buffer = shared_memory.SharedMemory(name=buffer_name)
+    composition = np.ndarray(shape, dtype=np.uint8, buffer=buffer.buf)
+    height, width = pixels.shape[:2]
+    composition[y:y + height, x:x + width] = pixels
+    del composition
+    buffer.close()
+    return time.time() - started
+
+
+# renders the tiles of a composition in a pool of processes, each one
+# written directly in the final image, which is then saved once. Each tile
+# is centered in its cell: columns are as wide as their widest tile, rows
+# as tall as their tallest one, and empty space is black. Returns the path
+# of the saved image
+def compose_image(tiles, columns, path, filename, gap=0, workers=1,
+                  cache_dir=None, image_format="png", compression=6,
+                  strategy="filtered"):
+    started = time.time()
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+
+    rows = len(tiles) // columns
+    sizes = np.array([calculate_size(t["bits"]) for t in tiles]).reshape(
+        rows, columns, 2)
+    widths = sizes[:, :, 0].max(axis=0)
+    heights = sizes[:, :, 1].max(axis=1)
+    # corner of each cell
+    lefts = np.concatenate(([0], np.cumsum(widths + gap)[:-1]))
+    tops = np.concatenate(([0], np.cumsum(heights + gap)[:-1]))
+    shape = (heights.sum() + gap * (rows - 1),
+             widths.sum() + gap * (columns - 1), 3)
+    logging.info(f"{filename}: {len(tiles)} tiles, {shape[1]}x{shape[0]} "
+                 "pixels")
+
+    buffer = shared_memory.SharedMemory(create=True,
+                                        size=int(np.prod(shape)))
+    try:
+        composition = np.ndarray(shape, dtype=np.uint8, buffer=buffer.buf)
+        composition[:] = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for x, settings in enumerate(tiles):
+                row, column = divmod(x, columns)
+                width, height = sizes[row, column]
+                left = lefts[column] + (widths[column] - width) // 2
+                top = tops[row] + (heights[row] - height) // 2
+                futures[executor.submit(render_tile, buffer.name, shape,
+                                        settings, int(left), int(top),
+                                        cache_dir)] = x
+
+            for completed, future in enumerate(as_completed(futures), 1):
+                x = futures[future]
+                logging.info(f"{filename}: tile {x+1}/{len(tiles)} placed "
+                             f"in {future.result():.1f} seconds, seed: "
+                             f"{tiles[x]['seed']} ({completed}/"
+                             f"{len(tiles)} completed)")
+
+        full_path = save_image(composition, path, filename, image_format,
+                               compression, strategy)
+        del composition
+    finally:
+        buffer.close()
+        buffer.unlink()
+
+    logging.info(f"{filename}: composition completed in "
+                 f"{time.time() - started:.1f} seconds")
+    return full_path
+
+
+# places the colors of an image for the render server and saves it in
+# the image cache, reporting the progress in the progress queue as (key,
+# placed colors, total colors). The image is saved with a temporary name
+# and then renamed, so the cache never holds half written images. Returns
+# the size of the image in bytes
+def render_job(key, settings, path, progress, cache_dir=None):
+    generator = EveryColor(**settings, cache_dir=cache_dir)
+    step = max(generator.total // 100, 1)
+    while not generator.done:
+        generator.step(step)
+        progress.put((key, generator.placed, generator.total))
+
+    temp_path = generator.save(path, f"{key}-tmp")
+    full_path = image_path(path, key)
+    os.replace(temp_path, full_path)
+    return os.path.getsize(full_path)
+
+
+# local render server. Render requests are http POSTs to /render with a
+# json object of settings (the ones in REQUEST_SETTINGS, the missing ones
+# get their default). The response is a stream of json lines with the
+# progress of the image, ending with its path, such as
+# /images/<key>.png. Images are cached by the hash of their settings: a
+# request for an image that is already cached is answered at once, while
+# requests for an image that is being placed follow the same placement.
+# Least recently used images are removed once the cache is bigger than
+# max_bytes
+class RenderServer:
+    # settings of a request and their default. The seed is needed
+    REQUEST_SETTINGS = {
+        "bits": 15,
+        "start_position": "center",
+        "start_points": 1,
+        "start_color": "random",
+        "sort_colors": "random",
+        "dist_selection": "min",
+        "seed": None,
+    }
+    # maximum size of the body of a request, in bytes
+    MAX_REQUEST_BYTES = 1 << 16
+    # maximum bits of a requested image
+    MAX_BITS = 24
+
+    def __init__(self, path, max_bytes, workers=1, cache_dir=None):
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__cache_dir = cache_dir
+        Path(path).mkdir(parents=True, exist_ok=True)
+
+        # cached images and their size, least recently used first
+        self.__images = collections.OrderedDict()
+        for image in sorted(Path(path).glob("*.png"),
+                            key=lambda p: p.stat().st_mtime):
+            if len(image.stem) == 64:
+                self.__images[image.stem] = image.stat().st_size
+
+        # images being placed: their last progress event and the queues
+        # of the clients following them
+        self.__jobs = {}
+        # workers are started on demand. Forked ones would keep the sockets
+        # of the connections open at that time. Workers and the manager of
+        # the progress queue ignore ctrl+c, close stops them
+        self.__executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=signal.signal, initargs=(signal.SIGINT,
+                                                 signal.SIG_IGN))
+        self.__manager = SyncManager()
+        self.__manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+        self.__progress = self.__manager.Queue()
+        # every child process but the workers
+        self.__helpers = {p.pid for p in multiprocessing.active_children()}
+        self.__loop = None
+
+    # settings of a request and the key of the image. Raises ValueError
+    # if the settings are not valid
+    def __parse(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("the request must be a json object")
+        unknown = set(request) - set(self.REQUEST_SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown settings: {', '.join(sorted(unknown))}")
+
+        settings = {**self.REQUEST_SETTINGS, **request}
+        if not isinstance(settings["seed"], str):
+            raise ValueError("seed is needed, as a string")
+        check_settings(settings)
+        if settings["bits"] > self.MAX_BITS:
+            raise ValueError(f"bits must be at most {self.MAX_BITS}")
+
+        key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+        return settings, key.hexdigest()
+
+    # total size of the cached images
+    @property
+    def cache_bytes(self):
+        return sum(self.__images.values())
+
+    # removes the least recently used images until the cache fits in
+    # max_bytes. The last image is always kept
+    def __evict(self):
+        while len(self.__images) > 1 and self.cache_bytes > self.__max_bytes:
+            key, size = self.__images.popitem(last=False)
+            Path(image_path(self.__path, key)).unlink(missing_ok=True)
+            logging.info(f"image {key} removed from the cache ({size} bytes)")
+
+    # marks a cached image as just used. Returns False if it's not cached
+    def __touch(self, key):
+        if key not in self.__images:
+            return False
+        full_path = image_path(self.__path, key)
+        if not Path(full_path).is_file():
+            # removed by someone else
+            del self.__images[key]
+            return False
+        self.__images.move_to_end(key)
+        os.utime(full_path)
+        return True
+
+    # sends an event to every client following a job
+    def __publish(self, key, event):
+        job = self.__jobs.get(key)
+        if job is None:
+            return
+        job["event"] = event
+        for client in job["clients"]:
+            client.put_nowait(event)
+
+    # forwards the progress of the workers to the event loop
+    def __forward_progress(self):
+        while True:
+            message = self.__progress.get()
+            if message is None:
+                return
+            key, placed, total = message
+            self.__loop.call_soon_threadsafe(self.__publish, key, {
+                "key": key,
+                "status": "running",
+                "placed": placed,
+                "total": total,
+                "progress": round(placed / total, 4),
+            })
+
+    # starts placing an image, unless it's already being placed. Returns
+    # a queue with the events of the job
+    def __follow(self, key, settings):
+        client = asyncio.Queue()
+        if key in self.__jobs:
+            # same image, same placement
+            job = self.__jobs[key]
+            client.put_nowait(job["event"])
+            job["clients"].add(client)
+            return client
+
+        event = {"key": key, "status": "queued"}
+        self.__jobs[key] = {"event": event, "clients": {client}}
+        client.put_nowait(event)
+        logging.info(f"image {key} queued, settings: {settings}")
+        future = self.__loop.run_in_executor(
+            self.__executor, render_job, key, settings, self.__path,
+            self.__progress, self.__cache_dir)
+        future.add_done_callback(lambda f: self.__finish(key, f))
+        return client
+
+    # an image has been placed, or its placement failed
+    def __finish(self, key, future):
+        if future.exception() is not None:
+            logging.error(f"image {key} failed: {future.exception()}")
+            event = {"key": key, "status": "error",
+                     "error": str(future.exception())}
+        else:
+            self.__images[key] = future.result()
+            self.__evict()
+            logging.info(f"image {key} saved, cache size: "
+                         f"{self.cache_bytes} bytes")
+            event = {"key": key, "status": "done",
+                     "image": f"/images/{key}.png"}
+        self.__publish(key, event)
+        del self.__jobs[key]
+
+    # writes an http response. The body is sent all at once unless it's
+    # None, in which case the connection is kept open for a stream
+    async def __respond(self, writer, status, body=None,
+                        content_type="application/json"):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                   405: "Method Not Allowed"}
+        headers = [f"HTTP/1.1 {status} {reasons[status]}",
+                   f"Content-Type: {content_type}",
+                   "Connection: close"]
+        if body is not None:
+            headers.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode())
+        if body is not None:
+            writer.write(body)
+        await writer.drain()
+
+    # sends an error as a json object
+    async def __error(self, writer, status, message):
+        await self.__respond(writer, status,
+                             json.dumps({"error": message}).encode())
+
+    # streams the events of an image as json lines, until it's done
+    async def __render(self, writer, request):
+        try:
+            settings, key = self.__parse(request)
+        except ValueError as e:
+            await self.__error(writer, 400, str(e))
+            return
+
+        await self.__respond(writer, 200, content_type="application/x-ndjson")
+        if key not in self.__jobs and self.__touch(key):
+            event = {"key": key, "status": "done", "cached": True,
+                     "image": f"/images/{key}.png"}
+            writer.write((json.dumps(event) + "\n").encode())
+            await writer.drain()
+            return
+
+        client = self.__follow(key, settings)
+        try:
+            while True:
+                event = await client.get()
+                writer.write((json.dumps(event) + "\n").encode())
+                await writer.drain()
+                if event["status"] in ["done", "error"]:
+                    return
+        finally:
+            # the placement goes on even if the client is gone
+            if key in self.__jobs:
+                self.__jobs[key]["clients"].discard(client)
+
+    # handles a single http request
+    async def __handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method, target = request_line[:2]
+
+            if target == "/render":
+                if method != "POST":
+                    await self.__error(writer, 405, "use POST")
+                    return
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= self.MAX_REQUEST_BYTES:
+                    await self.__error(writer, 400, "the content length "
+                                       "must be between 0 and "
+                                       f"{self.MAX_REQUEST_BYTES} bytes")
+                    return
+                body = await reader.readexactly(length)
+                try:
+                    request = json.loads(body or b"{}")
+                except ValueError:
+                    await self.__error(writer, 400, "the request must be "
+                                       "a json object")
+                    return
+                await self.__render(writer, request)
+            elif target.startswith("/images/") and target.endswith(".png"):
+                key = target[len("/images/"):-len(".png")]
+                if not self.__touch(key):
+                    await self.__error(writer, 404, "image not found")
+                    return
+                data = Path(image_path(self.__path, key)).read_bytes()
+                await self.__respond(writer, 200, data, "image/png")
+            elif target == "/status":
+                await self.__respond(writer, 200, json.dumps({
+                    "jobs": len(self.__jobs),
+                    "images": len(self.__images),
+                    "cache_bytes": self.cache_bytes,
+                    "max_bytes": self.__max_bytes,
+                }).encode())
+            else:
+                await self.__error(writer, 404, "unknown path")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # the client is gone
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping, the connection is closed
+            pass
+        finally:
+            writer.close()
+
+    # serves requests on address, host:port or the path of a unix socket,
+    # until SIGINT or SIGTERM. Without a host (:port) only local clients
+    # can connect, there's no authentication
+    async def serve(self, address):
+        self.__loop = asyncio.get_running_loop()
+        threading.Thread(target=self.__forward_progress, daemon=True).start()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            self.__loop.add_signal_handler(signum,
+                                           asyncio.current_task().cancel)
+
+        host, _, port = address.rpartition(":")
+        if "/" not in address and port.isdigit():
+            server = await asyncio.start_server(
+                self.__handle, host or "127.0.0.1", int(port))
+        else:
+            server = await asyncio.start_unix_server(self.__handle, address)
+        logging.info(f"serving on {address}, {len(self.__images)} cached "
+                     f"images ({self.cache_bytes} bytes)")
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                logging.info("server stopped")
+
+    # stops the workers. Images that are still being placed are abandoned
+    # rather than waited for, which could take hours
+    def close(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        workers = [p for p in multiprocessing.active_children()
+                   if p.pid not in self.__helpers]
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        for key in self.__jobs:
+            temp_path = image_path(self.__path, f"{key}-tmp")
+            Path(temp_path).unlink(missing_ok=True)
+            logging.warning(f"image {key} abandoned")
+        self.__executor.shutdown()
+
+        self.__progress.put(None)
+        self.__manager.shutdown()
+
+
+# sends the log records of a worker process to the parent
+def init_worker(log_queue):
+    logger = logging.getLogger()
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(logging.INFO)
+
+
+def main():
+    # arguments parsing
+    parser = argparse.ArgumentParser(description="Generate an image with all"
+                                     "the possible colors in the"
+                                     " RGB colorspace")
+
+    parser.add_argument("-b", "--bits", type=int,
+                        help="image depth bits (defaults to 15)", default=15)
+    parser.add_argument("-n", "--number", type=int,
+                        help="number of images to generate (defaults to 1)",
+                        default=1)
+    parser.add_argument("-p", "--startposition", action="store",
+                        choices=START_POSITIONS, default="center",
+                        help="location of the first pixel "
+                        "(defaults to center)")
+    parser.add_argument("-c", "--startcolor", action="store",
+                        choices=START_COLORS, default="random",
+                        help="color of the first pixel (defaults to random)")
+    parser.add_argument("-o", "--output", type=str, default="output",
+                        help="output folder (defaults to output) "
+                        "make sure that the path exists")
+    parser.add_argument("-l", "--log", action="store",
+                        choices=["file", "console"], default="file",
+                        help="log destination (defaults to file)")
+    parser.add_argument("--progresspics", type=int,
+                        help="number of progress pics to be saved "
+                        "(defaults to 0)", default=0)
+    parser.add_argument("--sortcolors", action="store",
+                        choices=SORT_COLORS, default="random",
+                        help="sort colors before placing them "
+                        "(defaults to random)")
+    parser.add_argument("--distselection", action="store",
+                        choices=DIST_SELECTIONS, default="min",
+                        help="select how new colors are selected according"
+                        "to their distance (defaults to min)")
+    parser.add_argument("--metric", action="store",
+                        choices=ColorSpace.METRICS, default="rgb",
+                        help="how the distance between colors is measured "
+                        "(defaults to rgb)")
+    parser.add_argument("--engine", action="store",
+                        choices=list(ENGINES), default="sort",
+                        help="placement engine. tree is much faster on big "
+                        "images (defaults to sort)")
+    parser.add_argument("--approx", type=int, choices=range(0, 9),
+                        default=0, metavar="{0..8}",
+                        help="approximate selection with the tree engine: "
+                        "colors are bucketed in cubes 2^APPROX wide and "
+                        "only the closest bucket is searched, 0 to disable "
+                        "(defaults to 0)")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="maximum number of colors placed at once by "
+                        "the vector engine, less when there are many "
+                        "available pixels (defaults to 1)")
+    parser.add_argument("--coarse", type=int, default=0,
+                        help="place the colors on an image with this many "
+                        "bits, then refine it up to the image bits, 3 bits "
+                        "at a time. 0 to disable (defaults to 0)")
+    parser.add_argument("--regions", action="store_true",
+                        help="grow the region around each starting point in "
+                        "its own process, then fill the seams between "
+                        "them. Needs corner or random start position, more "
+                        "than one start point and the tree or vector engine")
+    parser.add_argument("--startpoints", type=int,
+                        help="number of starting points (defaults to 1). "
+                        "Doesn't work if start position is set to center",
+                        default=1)
+    parser.add_argument("--seed", type=str, help="random seed", default=None)
+    parser.add_argument("--threads", type=int,
+                        help="threads used by the vector engine to score "
+                        "the available pixels (defaults to 1)", default=1)
+    parser.add_argument("--stream", action="store",
+                        choices=["rgb", "delta"], default=None,
+                        help="also save the placement as raw rgb24 frames "
+                        "or as a log of placed pixels (defaults to none)")
+    parser.add_argument("--framepixels", type=int,
+                        help="placed pixels between frames of the rgb "
+                        "stream and of --replay (defaults to 1000)",
+                        default=1000)
+    parser.add_argument("--replay", type=str,
+                        help="render a delta log into raw rgb24 frames "
+                        "and exit", default=None)
+    parser.add_argument("--map", action="store_true",
+                        help="also save the placement map of the image, "
+                        "used by --recolor")
+    parser.add_argument("--recolor", type=str,
+                        help="render an image again from its placement map, "
+                        "changed by --channels, --huerotation, --invert, "
+                        "--quantize and --placed, and exit (defaults to "
+                        "none)", default=None)
+    parser.add_argument("--channels", action="store",
+                        choices=["rgb", "rbg", "grb", "gbr", "brg", "bgr"],
+                        default="rgb",
+                        help="order of the color channels with --recolor "
+                        "(defaults to rgb)")
+    parser.add_argument("--huerotation", type=float, default=0,
+                        help="degrees the hues are rotated by with "
+                        "--recolor (defaults to 0)")
+    parser.add_argument("--invert", action="store_true",
+                        help="invert the colors with --recolor")
+    parser.add_argument("--quantize", type=int, default=0,
+                        help="reduce the colors to this many bits with "
+                        "--recolor. 0 to disable (defaults to 0)")
+    parser.add_argument("--placed", type=int, default=None,
+                        help="only show the first placed pixels with "
+                        "--recolor (defaults to all)")
+    parser.add_argument("--serve", type=str,
+                        help="serve render requests over http on HOST:PORT "
+                        "(such as localhost:8000) or on the path of a unix "
+                        "socket, placing --workers images at once and "
+                        "caching them in the output folder (defaults to "
+                        "none)", default=None)
+    parser.add_argument("--cachesize", type=float, default=1024,
+                        help="megabytes of images cached by --serve "
+                        "(defaults to 1024)")
+    parser.add_argument("--compose", type=str,
+                        help="json layout of a composition. Its tiles are "
+                        "placed by --workers processes and saved as a "
+                        "single image (defaults to none)", default=None)
+    parser.add_argument("--checkpoint", type=float,
+                        help="minutes between checkpoints, 0 to disable "
+                        "(defaults to 0, or to the minutes of the checkpoint "
+                        "with --resume)", default=None)
+    parser.add_argument("--resume", type=str,
+                        help="checkpoint to resume from. All the other "
+                        "image settings are ignored", default=None)
+    parser.add_argument("--stats", action="store_true",
+                        help="save progress, frontier size and time spent "
+                        "in each phase as json lines")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the placement with cProfile and save "
+                        "the stats next to the image")
+    parser.add_argument("--memmap", action="store_true",
+                        help="keep the image in a memory mapped file "
+                        "instead of memory, and save it strip by strip")
+    parser.add_argument("--cache", type=str,
+                        help="folder where palettes, sort keys and color "
+                        "coordinates are saved and shared between runs "
+                        "(defaults to none)", default=None)
+    parser.add_argument("--control", type=str,
+                        help="unix socket accepting pause, resume, "
+                        "snapshot, checkpoint, stop and status commands "
+                        "(defaults to none)", default=None)
+    parser.add_argument("--format", action="store",
+                        choices=["png", "webp", "npy"], default="png",
+                        help="format of the final image. webp is lossless, "
+                        "npy is the raw (height, width, 3) array "
+                        "(defaults to png)")
+    parser.add_argument("--compression", type=int, choices=range(0, 10),
+                        default=6, metavar="{0..9}",
+                        help="compression of the final image, from 0 "
+                        "(fastest) to 9 (smallest) (defaults to 6)")
+    parser.add_argument("--pngstrategy", action="store",
+                        choices=list(PNG_STRATEGIES), default="filtered",
+                        help="zlib strategy of the png compression "
+                        "(defaults to filtered)")
+    parser.add_argument("--workers", type=int,
+                        help="number of images generated in parallel "
+                        "(defaults to 1)", default=1)
+
+    args = parser.parse_args()
+
+    # logging setup
+    log_format = "%(asctime)s - %(levelname)s - %(message)s"
+    if args.workers > 1:
+        # tell the worker processes apart
+        log_format = "%(asctime)s - %(processName)s - %(levelname)s - " \
+                     "%(message)s"
+    if args.log == "file":
+        # logging filename generation
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        logfile = f"every-color-{now}.log"
+        logging.basicConfig(format=log_format, level=logging.INFO,
+                            filename=logfile, filemode="w+")
+        print(f"Logging in {logfile}")
+    else:
+        logging.basicConfig(format=log_format, level=logging.INFO)
+
+    logging.info("script started")
+
+    # seconds between checkpoints
+    checkpoint_interval = (args.checkpoint or 0) * 60
+
+    if args.framepixels < 1:
+        logging.error("the frame pixels must be at least 1")
+        return
+
+    if args.replay:
+        # frames are saved next to the delta log
+        frames_path = str(Path(args.replay).with_suffix(".rgb"))
+        width, height = replay_delta(args.replay, frames_path,
+                                     args.framepixels)
+        logging.info(f"frames saved: {frames_path}. Convert them with "
+                     f"ffmpeg -f rawvideo -pix_fmt rgb24 -s {width}x{height} "
+                     f"-r 25 -i {frames_path} out.mp4")
+        logging.info("script ended")
+        return
+
+    if args.recolor:
+        placement_map = load_placement_map(args.recolor)
+        if args.quantize and (args.quantize % 3 != 0 or
+                              args.quantize >= placement_map["bits"]):
+            logging.error("the quantize bit number must be divisible by 3 "
+                          "and less than the bit number of the map")
+            return
+        started = time.time()
+        pixels = recolor_image(placement_map, args.channels,
+                               args.huerotation, args.invert, args.quantize,
+                               args.placed)
+        # saved next to the placement map
+        map_path = Path(args.recolor)
+        filename = map_path.stem.removesuffix("-map") + "-recolored"
+        if args.placed is not None:
+            filename += f"-{args.placed}"
+        full_path = save_image(pixels, str(map_path.parent), filename,
+                               args.format, args.compression,
+                               args.pngstrategy)
+        logging.info(f"image recolored in {time.time() - started:.2f} "
+                     f"seconds, saved: {full_path}")
+        logging.info("script ended")
+        return
+
+    if args.serve:
+        server = RenderServer(args.output, int(args.cachesize * 2 ** 20),
+                              args.workers, args.cache)
+        try:
+            asyncio.run(server.serve(args.serve))
+        finally:
+            server.close()
+        logging.info("script ended")
+        return
+
+    if args.resume:
+        # settings are loaded from the checkpoint
+        checkpoint = load_checkpoint(args.resume)
+        settings = checkpoint["settings"]
+        if args.checkpoint is not None:
+            settings["checkpoint_interval"] = checkpoint_interval
+        logging.info(f"resuming {settings['filename']} from {args.resume}, "
+                     f"settings: {settings}")
+        if args.control:
+            try:
+                check_socket_path(args.control)
+            except ValueError as e:
+                logging.error(e)
+                return
+        full_image_path = render_image(**settings,
+                                       resume=checkpoint, stats=args.stats,
+                                       profile=args.profile,
+                                       control_path=args.control)
+        if full_image_path:
+            logging.info(f"image saved: {full_image_path}")
+        logging.info("script ended")
+        return
+
+    # color depth
+    bits = args.bits
+    try:
+        check_settings({
+            "bits": bits,
+            "start_points": args.startpoints,
+            "engine_name": args.engine,
+            "threads": args.threads,
+            "approx": args.approx,
+            "batch": args.batch,
+        })
+    except ValueError as e:
+        logging.error(e)
+        return
+
+    if args.coarse and (args.coarse % 3 != 0 or args.coarse >= bits):
+        logging.error("the coarse bit number must be divisible by 3 and "
+                      "less than the bit number")
+        return
+
+    if args.regions:
+        if args.startposition == "center" or args.startpoints < 2:
+            logging.error("region growth needs corner or random start "
+                          "position and more than one start point")
+            return
+        if args.engine not in ["tree", "vector"]:
+            logging.error("region growth needs the tree or vector engine")
+            return
+        if args.stream or args.checkpoint or args.progresspics or \
+                args.batch > 1:
+            logging.error("region growth can't be used with streams, "
+                          "checkpoints, progress pics or batch placement")
+            return
+
+    # random.seeding
+    seed = args.seed
+    if not seed:
+        # seed not provided, we use current time (converted to string)
+        seed = str(time.time())
+
+    # get output folder
+    path = args.output
+
+    if args.compose:
+        # command line settings are the defaults of the tiles
+        defaults = {
+            "bits": bits,
+            "seed": seed,
+            "start_position": args.startposition,
+            "start_points": args.startpoints,
+            "start_color": args.startcolor,
+            "sort_colors": args.sortcolors,
+            "dist_selection": args.distselection,
+            "metric": args.metric,
+            "engine_name": args.engine,
+            "approx": args.approx,
+            "batch": args.batch,
+        }
+        try:
+            tiles, columns, gap = load_layout(args.compose, defaults)
+        except (OSError, ValueError) as e:
+            logging.error(f"can't load the composition layout: {e}")
+            return
+
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        full_image_path = compose_image(tiles, columns, path,
+                                        f"composition-{now}", gap,
+                                        args.workers, args.cache,
+                                        args.format, args.compression,
+                                        args.pngstrategy)
+        logging.info(f"image saved: {full_image_path}")
+        logging.info("script ended")
+        return
+
+    logging.info(f"seed used for random functions: {seed}")
+    logging.info("basic setup completed, generating image with "
+                 f"{bits} bits")
+
+    width, height = calculate_size(bits)
+    start_position = args.startposition
+    start_points = args.startpoints
+    start_color = args.startcolor
+    sort_colors = args.sortcolors
+    dist_selection = args.distselection
+    metric = args.metric
+    progress_pics = args.progresspics
+    engine_name = args.engine
+    threads = args.threads
+    workers = args.workers
+    logging.info(f"start position: {start_position}, "
+                 f"start points: {start_points}, "
+                 f"start color: {start_color}, "
+                 f"sort color: {sort_colors}, "
+                 f"dist selection: {dist_selection}, "
+                 f"metric: {metric}, "
+                 f"saving progress pics: {progress_pics}, "
+                 f"engine: {engine_name}, "
+                 f"threads: {threads}, "
+                 f"workers: {workers}, "
+                 f"destination image size: {width}x{height} pixels.")
+
+    logging.info("starting pixels placement.")
+
+    logging.info("keep in mind that the remaining time is estimated from "
+                 "the speed observed so far, and it gets more accurate as "
+                 "the placement goes on. Don't panic, the script is most "
+                 "likely not stuck but very computationally heavy and as "
+                 "such quite slow. Let it run!")
+
+    images_to_generate = args.number
+    # output filename generation
+    now = datetime.now().strftime("%Y%m%d-%H%M%S")
+    jobs = []
+    for x in range(images_to_generate):
+        if images_to_generate > 1:
+            # each image has its own seed and an unique filename
+            image_seed = f"{seed}-{x+1}"
+            filename = f"every-color-{now}-{x+1}"
+        else:
+            image_seed = seed
+            filename = f"every-color-{now}"
+
+        jobs.append({
+            "bits": bits,
+            "seed": image_seed,
+            "path": path,
+            "filename": filename,
+            "start_position": start_position,
+            "start_points": start_points,
+            "start_color": start_color,
+            "sort_colors": sort_colors,
+            "dist_selection": dist_selection,
+            "metric": metric,
+            "progress_pics": progress_pics,
+            "engine_name": engine_name,
+            "threads": threads,
+            "stream": args.stream,
+            "frame_pixels": args.framepixels,
+            "checkpoint_interval": checkpoint_interval,
+            "stats": args.stats,
+            "profile": args.profile,
+            "memmap": args.memmap,
+            "approx": args.approx,
+            "batch": args.batch,
+            "cache_dir": args.cache,
+            "image_format": args.format,
+            "compression": args.compression,
+            "strategy": args.pngstrategy,
+            "coarse": args.coarse,
+            "regions": args.regions,
+            "placement_map": args.map,
+        })
+        if args.control:
+            # one socket for each image
+            jobs[-1]["control_path"] = args.control
+            if images_to_generate > 1:
+                jobs[-1]["control_path"] += f"-{x+1}"
+            try:
+                check_socket_path(jobs[-1]["control_path"])
+            except ValueError as e:
+                logging.error(e)
+                return
+
+    if args.cache:
+        # filled once, before the workers start loading it
+        placed_bits = args.coarse if args.coarse else bits
+        palette(placed_bits, args.cache)
+        sort_keys(placed_bits, sort_colors, args.cache)
+        color_space(placed_bits, metric, args.cache)
+
+    if workers > 1:
+        # log records of the workers are handled by the parent
+        log_queue = multiprocessing.Queue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *logging.getLogger().handlers)
+        listener.start()
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(log_queue,)) as executor:
+            futures = {}
+            for x, job in enumerate(jobs):
+                logging.info(f"queued image {x+1}/{images_to_generate}, "
+                             f"seed: {job['seed']}")
+                futures[executor.submit(render_image, **job)] = x
+
+            completed = 0
+            for future in as_completed(futures):
+                completed += 1
+                x = futures[future]
+                full_image_path = future.result()
+                if not full_image_path:
+                    logging.info(f"image {x+1}/{images_to_generate} stopped")
+                    continue
+                logging.info(f"image {x+1}/{images_to_generate} saved: "
+                             f"{full_image_path} ({completed}/"
+                             f"{images_to_generate} completed)")
+
+        listener.stop()
+    else:
+        # images are saved while the next one is placed
+        writer = ImageWriter(size=1)
+        for x, job in enumerate(jobs):
+            logging.info(f"started generating image {x+1}/"
+                         f"{images_to_generate}, seed: {job['seed']}")
+            full_image_path = render_image(**job, writer=writer)
+            if not full_image_path:
+                # the next images are not generated either
+                logging.info(f"image {x+1}/{images_to_generate} stopped")
+                break
+            logging.info(f"image {x+1}/{images_to_generate} placed, "
+                         f"saving it to {full_image_path}")
+        # wait for the last image
+        writer.close()
+
+    logging.info("script ended")
+
+
+if __name__ == "__main__":
+    main()